@@ -0,0 +1,258 @@
+# File path: bench.py
+"""Benchmarks of the hot paths on generated workbooks.
+
+Example: python bench.py --groups 200 --days 6 --subgroups 0.2 --output bench_results.json
+and later python bench.py --compare bench_results.json to see the change against a saved run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import func
+from func import (SHEET_NAME, HEADER_ROW, FIRST_DATE_ROW, DATE_COL,
+                  week_days, class_times_first_five_days, class_times_sixth_day)
+
+# Блоки групп начинаются со столбца I, по 4 столбца на группу, как в выгрузке колледжа
+TIME_COL = DATE_COL + 1
+FIRST_GROUP_COL = DATE_COL + 2
+BLOCK_WIDTH = 4
+FIRST_MONDAY = date(2024, 4, 15)
+
+DISCIPLINES = [
+    "Математика", "Информатика", "Физика", "История", "Литература", "Иностранный язык", "Биология",
+    "Обществознание", "Физическая культура", "МДК 01.01", "МДК 02.01", "Русский язык", "Химия",
+]
+CLASS_TYPES = ["Лекция, урок", "Пр. занятие"]
+SURNAMES = [
+    "Троицкая", "Гвоздев", "Онучина", "Жилова", "Щенникова", "Афонасьев", "Лялина", "Кокина",
+    "Глушкова", "Зонова", "Шило", "Шилова", "Булдакова", "Огородникова", "Долгушина", "Бахтина",
+]
+
+def teacher_name(rng):
+    return f"{rng.choice(SURNAMES)} {rng.choice('АБВГДЕ')}.{rng.choice('АБВГДЕ')}."
+
+def room_name(rng):
+    return f"{rng.choice((1, 2, 4, 5, 15, 19))}-{rng.randint(101, 420)}"
+
+def session_cells(rng, subgroup_share):
+    """Four cells of one class; a share of classes is split into two subgroups by newlines like in the sheet."""
+    if rng.random() < subgroup_share:
+        return [
+            f"{rng.choice(DISCIPLINES)} 1 подгруппа\n{rng.choice(DISCIPLINES)} 2 подгруппа",
+            rng.choice(CLASS_TYPES),
+            f"{teacher_name(rng)}\n{teacher_name(rng)}",
+            f"{room_name(rng)}\n{room_name(rng)}",
+        ]
+    return [rng.choice(DISCIPLINES), rng.choice(CLASS_TYPES), teacher_name(rng), room_name(rng)]
+
+def generate_workbook(path, groups=70, days=6, subgroup_share=0.1, fill=0.6, shared_header_share=0.1, seed=1):
+    """Write a workbook in the 'Колледж ВятГУ' layout and return (last row, last column) of its table."""
+    from openpyxl import Workbook
+
+    if not 1 <= days <= len(week_days):
+        raise ValueError(f"days должно быть от 1 до {len(week_days)}")
+    rng = random.Random(seed)
+
+    # Часть блоков, как в настоящем файле, подписана сразу двумя группами через перевод строки
+    block_headers = []
+    group_number = 0
+    while group_number < groups:
+        names = 2 if groups - group_number > 1 and rng.random() < shared_header_share else 1
+        block_headers.append("\n".join(f"Группа ТСТ-{group_number + i + 101}-52-00" for i in range(names)))
+        group_number += names
+    last_col = FIRST_GROUP_COL + len(block_headers) * BLOCK_WIDTH - 1
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(SHEET_NAME)
+    for _ in range(HEADER_ROW - 1):
+        sheet.append([])
+
+    header = [None] * (last_col + 1)
+    labels = [None] * (last_col + 1)
+    labels[DATE_COL], labels[TIME_COL] = "День недели", "Часы"
+    for block, block_header in enumerate(block_headers):
+        col = FIRST_GROUP_COL + block * BLOCK_WIDTH
+        header[col] = block_header
+        labels[col:col + BLOCK_WIDTH] = ["Дисциплина,модуль", "Вид занятия", "Преподаватель", "Аудитория"]
+    sheet.append(header)
+    sheet.append(labels)
+
+    last_row = FIRST_DATE_ROW - 1
+    for day_number in range(days):
+        class_times = class_times_first_five_days if day_number < 5 else class_times_sixth_day
+        day_date = FIRST_MONDAY + timedelta(days=day_number)
+        for slot, class_time in enumerate(class_times):
+            row = [None] * (last_col + 1)
+            if slot == 0:
+                row[DATE_COL] = f"{week_days[day_number].upper()}   {day_date:%d.%m}"
+            row[TIME_COL] = class_time
+            for block in range(len(block_headers)):
+                if rng.random() < fill:
+                    col = FIRST_GROUP_COL + block * BLOCK_WIDTH
+                    row[col:col + BLOCK_WIDTH] = session_cells(rng, subgroup_share)
+            sheet.append(row)
+            last_row += 1
+    workbook.save(path)
+    return last_row, last_col
+
+class sheet_bounds:
+    """Point the parser at the table size of a generated workbook and restore the real bounds afterwards."""
+
+    def __init__(self, last_row, last_col):
+        self.bounds = (last_row, last_col)
+
+    def __enter__(self):
+        self.saved = (func.LAST_ROW, func.LAST_COL)
+        func.LAST_ROW, func.LAST_COL = self.bounds
+
+    def __exit__(self, *exc_info):
+        func.LAST_ROW, func.LAST_COL = self.saved
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+def measure(name, calls, results):
+    """Time every call separately, then repeat the first call under tracemalloc for its peak memory."""
+    samples = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    calls[0]()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    results[name] = {
+        'calls': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p90_ms': percentile(samples, 0.90) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'max_ms': samples[-1] * 1000,
+        'peak_kib': peak / 1024,
+    }
+    print(f"{name:32} p50 {results[name]['p50_ms']:9.3f} мс  p99 {results[name]['p99_ms']:9.3f} мс  "
+          f"пик {results[name]['peak_kib']:9.0f} КиБ")
+
+def bench_schedule(workbook_path, args, rng, results):
+    import utils
+    from snapshot import snapshot_path
+
+    def cold_load():
+        if os.path.exists(snapshot_path(workbook_path)):
+            os.remove(snapshot_path(workbook_path))
+        return utils.load_schedule(workbook_path)
+
+    measure('extract_schedule_to_json', [lambda: func.extract_schedule_to_json(workbook_path)] * args.repeat, results)
+    measure('load_schedule_cold', [cold_load] * args.repeat, results)
+    state = utils.load_schedule(workbook_path)
+    measure('load_schedule_snapshot', [lambda: utils.load_schedule(workbook_path)] * args.repeat, results)
+
+    group_names = list(state.schedule_data.keys())
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(group_names).replace("Группа", "").strip()
+        start = rng.randrange(len(name) - 2)
+        queries.append(name[start:start + rng.randint(2, 6)])
+    measure('filter_groups', [lambda query=query: utils.filter_groups(query, group_names) for query in queries], results)
+    measure('group_index.search', [lambda query=query: state.group_index.search(query) for query in queries], results)
+
+    surnames = [rng.choice(SURNAMES) for _ in range(args.queries)]
+    measure('find_teacher_days', [lambda surname=surname: utils.find_teacher_days(state.teacher_index, surname)
+                                  for surname in surnames], results)
+
+    groups = [rng.choice(group_names) for _ in range(args.queries)]
+    measure('get_schedule_for_week', [lambda group=group: utils.get_schedule_for_week(state.schedule_data, group)
+                                      for group in groups], results)
+    return group_names
+
+def bench_db(group_names, args, rng, results):
+    # users.db открывается в текущем каталоге, поэтому база создаётся уже во временном каталоге
+    import db
+    db.init_db()
+
+    user_ids = [rng.randint(1, args.users) for _ in range(args.db_writes)]
+    measure('add_or_update_user', [
+        lambda user_id=user_id: db.add_or_update_user(user_id, f"user{user_id}", rng.choice(group_names))
+        for user_id in user_ids
+    ], results)
+    db.flush_pending_users()
+
+    def write_batch():
+        for user_id in user_ids[:500]:
+            db.add_or_update_user(user_id, f"user{user_id}", rng.choice(group_names))
+        db.flush_pending_users()
+    measure('db_write_batch_500', [write_batch] * 5, results)
+    measure('get_recent_groups', [lambda user_id=user_id: db.get_recent_groups(user_id) for user_id in user_ids], results)
+
+def compare(baseline_path, results):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    print(f"\nСравнение с {baseline_path} (p50, во сколько раз быстрее; меньше 1 - регрессия):")
+    for name, result in results.items():
+        if name in baseline and result['p50_ms']:
+            print(f"{name:32} {baseline[name]['p50_ms']:9.3f} -> {result['p50_ms']:9.3f} мс  x{baseline[name]['p50_ms'] / result['p50_ms']:.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора расписания, поиска и записи в базу")
+    parser.add_argument('--groups', type=int, default=70)
+    parser.add_argument('--days', type=int, default=6)
+    parser.add_argument('--subgroups', type=float, default=0.1, help="доля занятий, разделённых на подгруппы")
+    parser.add_argument('--fill', type=float, default=0.6, help="доля заполненных ячеек занятий")
+    parser.add_argument('--repeat', type=int, default=5, help="повторов для разбора и загрузки")
+    parser.add_argument('--queries', type=int, default=500, help="запросов для поиска и выдачи расписания")
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--db-writes', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    parser.add_argument('--compare', help="JSON прошлого запуска для сравнения")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    results = {}
+    workdir = tempfile.mkdtemp(prefix='schedule-bench-')
+    cwd = os.getcwd()
+    try:
+        workbook_path = os.path.join(workdir, 'schedule_bench.xlsx')
+        last_row, last_col = generate_workbook(workbook_path, args.groups, args.days, args.subgroups, args.fill, seed=args.seed)
+        print(f"Книга: {args.groups} групп, {args.days} дн., {os.path.getsize(workbook_path) / 1024:.0f} КиБ")
+        with sheet_bounds(last_row, last_col):
+            group_names = bench_schedule(workbook_path, args, rng, results)
+        os.chdir(workdir)
+        bench_db(group_names, args, rng, results)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'params': vars(args),
+        },
+        'results': results,
+    }
+    if args.compare:
+        compare(args.compare, results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,82 @@
 # File path: bot.py
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, MessageHandler, Filters, CallbackContext, ConversationHandler
+import multiprocessing
 import os
+import re
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from utils import *
 from db import *
-
-schedule_data = {} 
-teacher_days = {}
+from broadcast import Broadcast
+from diff import diff_schedules, format_group_change
+from metrics import observe, start_metrics_server, summary, timed_handler
+from keyboards import DAY_BACK_MARKUP, OPTIONS_BACK_MARKUP
+from digest import DIGEST_DAYS, DIGEST_TIME, DIGEST_TIMEZONE, run_digest
+from history import ScheduleHistory, week_start
+from ical import group_calendar, teacher_calendar, write_calendar
+from profiling import MAX_PROFILE_SECONDS, arm_memtrace, finish_memtrace, start_memtrace, start_profile
+
+# Текущее расписание со всеми индексами; при обновлении заменяется целиком одним присваиванием
+current_schedule = build_schedule_state({})
+teacher_results = TeacherResultCache()
+# Все загруженные недели в базе; текущая и соседние держатся в памяти
+schedule_history = ScheduleHistory()
+# Разбор загруженных файлов выполняется по одному и вне потоков диспетчера
+reload_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='schedule-reload')
+# Сам разбор xlsx занимает процессор, поэтому выполняется в отдельном процессе (spawn: без копии потоков бота).
+# Процесс запускается при первой загрузке файла, а не при импорте: дочерний процесс spawn сам импортирует этот модуль
+parse_executor = None
+parse_executor_lock = threading.Lock()
+# Одновременно идёт не больше одной рассылки
+broadcast_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='broadcast-run')
+BOT_TOKEN = "6668495629:AAGlmeOCtw9dQxSXr31UugK9bLGfsimw-Xg"
+# Адреса Bot API; для офлайн-проверки - локальный сервер из fake_bot_api.py, например 'http://127.0.0.1:8081/bot'
+BOT_API_URL = None
+BOT_FILE_URL = None
+# Сколько обновлений обрабатывается одновременно; остальные ждут в очереди диспетчера
+UPDATE_WORKERS = 16
 USERS_PER_PAGE = 10
+# Для стольких самых популярных групп расписание рендерится сразу после загрузки
+WARM_GROUPS = 20
 SCHEDULE_FILE = 'schedule_file.xlsx'
+# Telegram id тех, кому доступны /stats, /profile и /memtrace; пустой набор - команды отключены
+ADMIN_IDS = set()
+UPLOAD_FILE = 'schedule_upload.xlsx'
 
 def list_users(update: Update, context: CallbackContext):
     query = update.callback_query
-    # Check if user_list_page is initialized, if not, initialize it to 0
-    if 'user_list_page' not in context.user_data:
-        context.user_data['user_list_page'] = 0
-    
-    page = context.user_data['user_list_page']  # Current page, default to 0
-    users = get_all_users()
+    # Стек курсоров: для каждой открытой страницы храним id, после которого она начинается.
+    # Новый вызов команды начинает список с первой страницы (id пользователей Telegram положительные)
+    if not query or 'user_list_cursors' not in context.user_data:
+        context.user_data['user_list_cursors'] = [0]
+    cursors = context.user_data['user_list_cursors']
+    page = len(cursors) - 1
+
+    # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+    users = get_users_page(cursors[-1], USERS_PER_PAGE + 1)
+    page_users = users[:USERS_PER_PAGE]
+    has_next_page = len(users) > USERS_PER_PAGE
+    context.user_data['user_list_next_cursor'] = page_users[-1][0] if page_users else cursors[-1]
     
     # Calculate total number of pages
-    total_pages = len(users) // USERS_PER_PAGE + (1 if len(users) % USERS_PER_PAGE > 0 else 0)
-    
-    # Get users for the current page
-    page_users = users[page * USERS_PER_PAGE:(page + 1) * USERS_PER_PAGE]
+    user_count = get_user_count()
+    total_pages = max(user_count // USERS_PER_PAGE + (1 if user_count % USERS_PER_PAGE > 0 else 0), page + 1)
 
     # Form the message text
     message_text = f"Список пользователей ({page + 1}/{total_pages}):\n\n"
     for user in page_users:
-        telegram_login, recent_groups = user
+        _, telegram_login, recent_groups = user
         message_text += f"@{telegram_login}: {recent_groups}\n"
 
     # Create buttons for pagination
     buttons = []
     if page > 0:
         buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data='list_users_prev_page'))
-    if page + 1 < total_pages:
+    if has_next_page:
         buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data='list_users_next_page'))
 
     # Add buttons to the markup
@@ -47,17 +88,91 @@ def list_users(update: Update, context: CallbackContext):
     else:
         update.message.reply_text(message_text, reply_markup=reply_markup)
 
+def warm_render_cache(schedule_state):
+    schedule_state.render_cache.warm(get_popular_groups(WARM_GROUPS))
+
+def notify_schedule_changes(bot, old_schedule, new_schedule):
+    """Send each changed group's summary only to users who have that group among their recent ones."""
+    changes = diff_schedules(old_schedule, new_schedule)
+    notified = 0
+    for change in changes:
+        audience = get_group_audience(change.group_name)
+        if not audience:
+            continue
+        notified += len(audience)
+        broadcast_executor.submit(
+            Broadcast(bot, audience, format_group_change(change), mark_blocked=mark_users_blocked, parse_mode='HTML').run
+        )
+    return len(changes), notified
+
+def import_history(schedule_state):
+    """Save the loaded week into the history store; on failure the history just misses this week."""
+    try:
+        schedule_history.import_schedule(schedule_state.schedule_data, schedule_state.day_dates)
+    except Exception as e:
+        print(f"Не удалось сохранить расписание в историю: {e}")
+
+def get_parse_executor():
+    global parse_executor
+    with parse_executor_lock:
+        if parse_executor is None:
+            parse_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return parse_executor
+
+def shutdown_parse_executor():
+    with parse_executor_lock:
+        if parse_executor is not None:
+            parse_executor.shutdown()
+
+def reload_schedule_job(bot, file_id, progress_message):
+    global current_schedule
+    upload_path = UPLOAD_FILE
+    try:
+        try:
+            # После /memtrace память трассируется только на время этой загрузки
+            start_memtrace()
+            started = time.perf_counter()
+            # Скачиваем во временный файл: рабочий файл заменяется только после успешного разбора
+            bot.get_file(file_id).download(custom_path=upload_path)
+            new_schedule = reload_schedule(upload_path, SCHEDULE_FILE, get_parse_executor())
+            warm_render_cache(new_schedule)
+            elapsed = time.perf_counter() - started
+            observe('bot_handler_seconds', (('handler', 'update_schedule'), ('type', 'reload')), elapsed)
+        except Exception as e:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            print(f"Ошибка при обновлении расписания: {e}")
+            progress_message.edit_text(f"Ошибка обработки файла, оставлено прежнее расписание: {e}")
+            return
+
+        old_schedule, current_schedule = current_schedule, new_schedule
+        teacher_results.clear()
+        # Снимок «после» берётся сразу после замены: новое расписание на месте старого, рассылки в отчёт не попадают
+        send_memtrace_report(bot)
+        # Расписание уже заменено: ошибки дальше не должны выглядеть как отказ от загрузки
+        try:
+            # Неделя, загруженная заранее, не вытесняет текущую: обе остаются в истории
+            import_history(new_schedule)
+            changed_groups, notified = notify_schedule_changes(bot, old_schedule, new_schedule)
+        except Exception as e:
+            print(f"Ошибка при рассылке изменений расписания: {e}")
+            progress_message.edit_text(
+                f"Расписание обновлено за {elapsed:.2f} с, но уведомления не отправлены: {e}"
+            )
+            return
+        progress_message.edit_text(
+            f"Расписание успешно обновлено за {elapsed:.2f} с. Групп: {len(new_schedule.schedule_data)}. "
+            f"Изменилось групп: {changed_groups}, уведомлений: {notified}."
+        )
+    finally:
+        # Если разбор не удался, трассировка всё равно выключается, а отчёт показывает неудачную загрузку
+        send_memtrace_report(bot)
+
 def update_schedule(update: Update, context: CallbackContext):
-    global schedule_data
     document = update.message.document
     if document:
-        file = context.bot.get_file(document.file_id)
-        # Загружаем файл под постоянным именем 'schedule_file.xlsx'
-        file.download(custom_path='schedule_file.xlsx')  # Сохраняем файл под нужным именем
-        
-        # Загружаем расписание из обновленного файла
-        schedule_data = load_schedule('schedule_file.xlsx')
-        update.message.reply_text("Расписание успешно обновлено.")
+        progress_message = update.message.reply_text("Файл получен, обрабатываю расписание...")
+        reload_executor.submit(reload_schedule_job, context.bot, document.file_id, progress_message)
     else:
         update.message.reply_text("Ошибка загрузки файла.")
         
@@ -65,13 +180,10 @@ def start(update: Update, context: CallbackContext):
     user_id = update.message.from_user.id
     telegram_login = update.message.from_user.username
 
-    user_info = get_user(user_id)
-    if user_info:
-        add_or_update_user(user_id, telegram_login, user_info[2])
-    else:
-        add_or_update_user(user_id, telegram_login, None)
+    # Последние группы пользователя при этом сохраняются
+    add_or_update_user(user_id, telegram_login, None)
 
-    if not schedule_data:
+    if not current_schedule.schedule_data:
         update.message.reply_text("Расписание отсутствует. Пожалуйста, загрузите файл с расписанием с помощью команды /update_schedule.")
     else:
         context.user_data['page'] = 0
@@ -81,56 +193,71 @@ def start(update: Update, context: CallbackContext):
         
 def handle_day_schedule(query, group_name, day_offset):
     schedule_text = f"Расписание на день для группы {group_name.replace("Группа", "").strip()}:\n\n"
-    schedule_text += get_schedule_for_day(schedule_data, group_name, day_offset)
-    keyboard = [
-        [InlineKeyboardButton("Назад 🔙", callback_data='back_to_day_selection')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    query.edit_message_text(text=schedule_text, reply_markup=reply_markup, parse_mode='HTML')
+    schedule_text += current_schedule.render_cache.day(group_name, day_offset)
+    query.edit_message_text(text=schedule_text, reply_markup=DAY_BACK_MARKUP, parse_mode='HTML')
+
+def handle_date_schedule(query, group_name, day_month):
+    """Day view by the date on the button (date_<дд.мм>): a day of the loaded week comes from the render cache,
+    a day of any other week from the schedule history."""
+    schedule_state = current_schedule
+    day_text = schedule_state.render_cache.day_by_date(group_name, day_month)
+    if day_text is None:
+        day_date = schedule_date(schedule_state, day_month, datetime.now(LOCAL_TIMEZONE).date())
+        day_schedule = schedule_history.day(group_name, day_date) if day_date else None
+        if day_schedule is None:
+            query.edit_message_text(text="Информация для этого дня недоступна.", reply_markup=DAY_BACK_MARKUP)
+            return
+        day_text = render_day(day_schedule)
+    schedule_text = f"Расписание на день для группы {group_name.replace("Группа", "").strip()}:\n\n"
+    schedule_text += day_text
+    query.edit_message_text(text=schedule_text, reply_markup=DAY_BACK_MARKUP, parse_mode='HTML')
 
-def handle_week_schedule(query, group_name):
-    schedule_text = f"Расписание на неделю для группы {group_name.replace("Группа", "").strip()}:\n\n"
-    schedule_text += get_schedule_for_week(schedule_data, group_name)
-    keyboard = [[InlineKeyboardButton("Назад 🔙", callback_data='back_to_schedule_options')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+def week_markup(monday):
+    """Buttons to the neighbouring stored weeks and back to the schedule options."""
+    previous_week, next_week = schedule_history.adjacent_weeks(monday)
+    buttons = []
+    if previous_week:
+        buttons.append(InlineKeyboardButton(f"⬅️ {previous_week:%d.%m}", callback_data=f"week_{previous_week.isoformat()}"))
+    if next_week:
+        buttons.append(InlineKeyboardButton(f"{next_week:%d.%m} ➡️", callback_data=f"week_{next_week.isoformat()}"))
+    keyboard = [buttons] if buttons else []
+    keyboard.append([InlineKeyboardButton("Назад 🔙", callback_data='back_to_schedule_options')])
+    return InlineKeyboardMarkup(keyboard)
+
+def handle_week_schedule(query, group_name, monday=None):
+    """Current week from the render cache, or the week starting on monday from the history."""
+    title = group_name.replace("Группа", "").strip()
+    today = datetime.now(LOCAL_TIMEZONE).date()
+    if monday is None:
+        schedule_text = f"Расписание на неделю для группы {title}:\n\n"
+        schedule_text += current_schedule.render_cache.week(group_name)
+        group_schedule = current_schedule.schedule_data.get(group_name)
+        first_date = current_schedule.day_dates.get(group_schedule.days[0].date) if group_schedule and group_schedule.days else None
+        monday = week_start(first_date) if first_date else None
+    else:
+        schedule_text = f"Расписание на неделю с {monday:%d.%m} для группы {title}:\n\n"
+        schedule_text += get_schedule_for_week(schedule_history.week(monday), group_name)
+    reply_markup = week_markup(monday) if monday else OPTIONS_BACK_MARKUP
     query.edit_message_text(text=schedule_text, reply_markup=reply_markup, parse_mode='HTML')
 
 def select_day_of_week(update: Update, context: CallbackContext):
     group_name = context.user_data.get('selected_group')
     text = f"Выберите день для группы {group_name.replace("Группа", "").strip()}:\n"
-    group_schedule = schedule_data.get(group_name, {})
-    dates = list(group_schedule.keys())
-
-    keyboard = [[InlineKeyboardButton(date, callback_data=f'day_{i}')] for i, date in enumerate(dates)]
-    keyboard.append([InlineKeyboardButton("Назад 🔙", callback_data='back_to_schedule_options')])
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Клавиатуры дней строятся один раз при загрузке расписания
+    reply_markup = current_schedule.keyboards.days_markup(group_name)
     query = update.callback_query
     query.edit_message_text(text=text, reply_markup=reply_markup)
 
 def send_schedule_options(update: Update, context: CallbackContext):
     group_name = context.user_data.get('selected_group')
-    group_schedule = schedule_data.get(group_name, {})
-    dates = list(group_schedule.keys())
-    start_date = dates[0] if dates else "Н/Д"
-    end_date = dates[-1] if dates else "Н/Д"
     text = f"Расписание для группы {group_name.replace("Группа", "").strip()}. Выберите опцию расписания:"
-
-    week_button_text = f"На неделю ({start_date.split(', ')[1]} - {end_date.split(', ')[1]})"
-
-    keyboard = [
-        [InlineKeyboardButton(week_button_text, callback_data='week')],
-        [InlineKeyboardButton("Выбрать день", callback_data='select_day')],
-        [InlineKeyboardButton("Назад 🔙", callback_data='back_to_group_selection')]
-    ]
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = current_schedule.keyboards.options_markup(group_name)
     query = update.callback_query
     query.edit_message_text(text=text, reply_markup=reply_markup)
 
 def search_group_result(update: Update, context: CallbackContext):
     user_input = update.message.text
-    filtered_groups = filter_groups(user_input, schedule_data.keys())
+    filtered_groups = current_schedule.group_index.search(user_input)
 
     if filtered_groups:
         keyboard = [[InlineKeyboardButton(group, callback_data='group_' + group)] for group in filtered_groups]
@@ -144,36 +271,14 @@ def send_group_keyboard(update: Update, context: CallbackContext):
     page = context.user_data.get('page', 0)
     user_id = update.effective_user.id
 
-    user_info = get_user(user_id)
-    recent_groups = user_info[2].split(",") if user_info and user_info[2] else []
-
-    group_keys = list(schedule_data.keys())
-
-    marked_groups = {group: f"★ {group}" for group in recent_groups}
-    sorted_groups = sorted(group_keys, key=lambda x: (x not in marked_groups, x))
-
-    max_page = (len(sorted_groups) - 1) // GROUPS_PER_PAGE
-    start_index = page * GROUPS_PER_PAGE
-    end_index = min(start_index + GROUPS_PER_PAGE, len(sorted_groups))
-    keyboard_groups = sorted_groups[start_index:end_index]
+    recent_groups = get_recent_groups(user_id)
+    keyboards = current_schedule.keyboards
 
     # Form the message text with current page number and total pages
-    message_text = f"Выберите группу или начните поиск ({page + 1}/{max_page + 1}):\n"
-
-    keyboard = [[InlineKeyboardButton(marked_groups.get(group, group), callback_data='group_' + group)] for group in keyboard_groups]
-    keyboard.append([InlineKeyboardButton("Поиск 🔍", callback_data='start_search')])
-    
-    keyboard.append([InlineKeyboardButton("Поиск преподавателя 🔍", callback_data='search_teacher_prompt')])
-
-    navigation_buttons = []
-    if page > 0:
-        navigation_buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data='prev_page'))
-    if page < max_page:
-        navigation_buttons.append(InlineKeyboardButton("Вперед ➡️", callback_data='next_page'))
-    if navigation_buttons:
-        keyboard.append(navigation_buttons)
+    message_text = f"Выберите группу или начните поиск ({page + 1}/{keyboards.page_count()}):\n"
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Общий порядок групп готов заранее, звёздочки последних групп пользователя накладываются здесь
+    reply_markup = keyboards.page_markup(page, recent_groups)
 
     if query:
         query.edit_message_text(text=message_text, reply_markup=reply_markup)
@@ -192,9 +297,26 @@ def button(update: Update, context: CallbackContext) -> None:
     if data == 'search_teacher_prompt':
         query.edit_message_text("Введите команду в формате: /search_teacher <Фамилия преподавателя>")
     elif data.startswith("show_day_"):
-        day_name = data.split("show_day_")[1]
+        # show_day_<фамилия>_<дд.мм>: результат берётся из общего кеша по фамилии, а не из последнего поиска
+        payload = data.split("show_day_", 1)[1]
+        if '_' not in payload:
+            # Кнопка из старой версии бота (show_day_<день>) без фамилии преподавателя
+            query.edit_message_text("Кнопка устарела, повторите поиск: /search_teacher <Фамилия преподавателя>")
+            return
+        key, day_date = payload.rsplit('_', 1)
+        matches = teacher_results.lookup(current_schedule, key)
+        teacher_days = matches[0][1] if len(matches) == 1 else {}
+        day_name = next((day_name for day_name in teacher_days if day_name.endswith(day_date)), day_date)
         schedule_for_day = show_teacher_schedule_for_day(teacher_days, day_name)
         query.edit_message_text(text=schedule_for_day, parse_mode='HTML')
+    elif data.startswith("teacher_"):
+        key = data.split("teacher_", 1)[1]
+        matches = teacher_results.lookup(current_schedule, key)
+        reply_markup = teacher_days_markup(*matches[0]) if len(matches) == 1 else None
+        if reply_markup:
+            query.edit_message_text(f"Преподаватель {key.capitalize()}. Выберите день:", reply_markup=reply_markup)
+        else:
+            query.edit_message_text("Для этого преподавателя занятий не найдено.")
     elif data.startswith('group_'):
         selected_group = data.split('_', 1)[1].replace(' ★', '')  # Убираем звездочку, если она есть
         context.user_data['selected_group'] = selected_group
@@ -211,6 +333,21 @@ def button(update: Update, context: CallbackContext) -> None:
         else:
             query.edit_message_text(text="Не выбрана группа.")
             
+    elif data.startswith('week_'):
+        selected_group = context.user_data.get('selected_group')
+        if selected_group:
+            handle_week_schedule(query, selected_group, date.fromisoformat(data.split('_', 1)[1]))
+        else:
+            query.edit_message_text(text="Не выбрана группа.")
+
+    elif data.startswith('date_'):
+        selected_group = context.user_data.get('selected_group')
+        if selected_group:
+            handle_date_schedule(query, selected_group, data.split('_', 1)[1])
+        else:
+            query.edit_message_text(text="Не выбрана группа.")
+
+    # Кнопки day_<номер> из сообщений, отправленных до перехода на даты
     elif data.startswith('day_'):
         selected_group = context.user_data.get('selected_group')
         day_offset = int(data.split('_')[1])
@@ -234,10 +371,13 @@ def button(update: Update, context: CallbackContext) -> None:
         elif data == 'back_to_day_selection':
             select_day_of_week(update, context)
     elif data == 'list_users_next_page':
-        context.user_data['user_list_page'] += 1
+        cursors = context.user_data.setdefault('user_list_cursors', [0])
+        cursors.append(context.user_data.get('user_list_next_cursor', cursors[-1]))
         list_users(update, context)
     elif data == 'list_users_prev_page':
-        context.user_data['user_list_page'] = max(0, context.user_data.get('user_list_page', 1) - 1)
+        cursors = context.user_data.setdefault('user_list_cursors', [0])
+        if len(cursors) > 1:
+            cursors.pop()
         list_users(update, context)
     elif data == 'start_search':
         query.edit_message_text(text="Введите название для поиска:")
@@ -269,17 +409,262 @@ def message_all_users(update: Update, context: CallbackContext):
     
     # Получаем текст сообщения из аргумента команды
     text = ' '.join(context.args)
-    # Получаем список всех пользователей из базы данных
-    all_users = get_all_user_ids()
-    # Отправляем сообщение каждому пользователю
-    for user_id in all_users:
-        try:
-            context.bot.send_message(user_id, text)
-        except Exception as e:
-            update.message.reply_text(f"Ошибка при отправке сообщения пользователю {user_id}: {e}, @{get_user(user_id)}")
-    # Ответим на команду в чате
-    update.message.reply_text("Сообщение разослано всем участникам бота.")
+    if not text:
+        update.message.reply_text("Введите команду в формате: /message <текст сообщения>")
+        return
+    # Пользователи, заблокировавшие бота, в рассылку не попадают
+    user_ids = get_broadcast_user_ids()
+    status_message = update.message.reply_text(f"Рассылка: 0/{len(user_ids)}...")
+    # Рассылка идёт в фоне с ограничением скорости, итог появится в том же сообщении
+    broadcast_executor.submit(Broadcast(context.bot, user_ids, text, status_message, mark_users_blocked).run)
     
+def stats_command(update: Update, context: CallbackContext):
+    if not is_admin(update):
+        return
+    lines = [f"Групп: {len(current_schedule.schedule_data)}, пользователей: {get_user_count()}", "", "Обработчики:"]
+    for labels, count, errors, average, p95 in summary()[:15]:
+        lines.append(f"{labels['handler']}/{labels['type']}: {count} раз, ошибок {errors}, "
+                     f"среднее {average * 1000:.1f} мс, p95 ≤ {p95 * 1000:.0f} мс")
+    lines.extend(["", "База данных:"])
+    for labels, count, errors, average, p95 in summary('bot_db_seconds', 'bot_db_errors_total')[:10]:
+        lines.append(f"{labels['query']}: {count} раз, ошибок {errors}, среднее {average * 1000:.2f} мс")
+    update.message.reply_text("\n".join(lines))
+
+def callback_kind(update):
+    """Callback type for metrics: the prefix of data like group_<name>, the whole data for fixed buttons."""
+    data = update.callback_query.data if update.callback_query else ""
+    for prefix in ("show_day_", "teacher_", "group_", "week_", "date_", "day_"):
+        if data.startswith(prefix):
+            return prefix[:-1]
+    return data
+
+def cache_stats(update: Update, context: CallbackContext):
+    stats = current_schedule.render_cache.stats()
+    teacher_stats = teacher_results.stats()
+    history_stats = schedule_history.stats()
+    update.message.reply_text(
+        f"Кеш расписаний: {stats['entries']} записей, попаданий {stats['hits']}, промахов {stats['misses']}.\n"
+        f"Кеш поиска преподавателей: {teacher_stats['entries']} записей, попаданий {teacher_stats['hits']}, "
+        f"промахов {teacher_stats['misses']}.\n"
+        f"Недели истории в памяти: {history_stats['entries']}, попаданий {history_stats['hits']}, "
+        f"промахов {history_stats['misses']}."
+    )
+
+def is_admin(update):
+    if update.message.from_user.id in ADMIN_IDS:
+        return True
+    update.message.reply_text("Команда доступна только администраторам.")
+    return False
+
+def profile_command(update: Update, context: CallbackContext):
+    if not is_admin(update):
+        return
+    try:
+        seconds = int(context.args[0]) if context.args else 30
+    except ValueError:
+        seconds = 0
+    if not 1 <= seconds <= MAX_PROFILE_SECONDS:
+        update.message.reply_text(f"Введите команду в формате: /profile <секунды от 1 до {MAX_PROFILE_SECONDS}>")
+        return
+
+    chat_id = update.message.chat_id
+    # Выборка идёт в отдельном потоке, отчёт придёт отдельным сообщением по окончании окна
+    if start_profile(seconds, lambda report: context.bot.send_message(chat_id, report)):
+        update.message.reply_text(f"Профилирование запущено на {seconds} с.")
+    else:
+        update.message.reply_text("Профилирование уже идёт, дождитесь отчёта.")
+
+def memtrace_command(update: Update, context: CallbackContext):
+    if not is_admin(update):
+        return
+    arm_memtrace(update.message.chat_id)
+    update.message.reply_text("Трассировка памяти включится на время следующей загрузки расписания, после неё придёт отчёт.")
+
+def send_memtrace_report(bot):
+    result = finish_memtrace()
+    if result:
+        chat_id, report = result
+        bot.send_message(chat_id, report)
+
+def current_group(update, context):
+    """Group the user is working with: the one selected now, else the last of the recent ones; None if neither."""
+    group_name = context.user_data.get('selected_group')
+    if group_name:
+        return group_name
+    recent_groups = get_recent_groups(update.message.from_user.id)
+    return recent_groups[-1] if recent_groups else None
+
+def digest_command(update: Update, context: CallbackContext):
+    user_id = update.message.from_user.id
+    subscribed_group = get_digest_subscription(user_id)
+    if context.args and context.args[0].lower() in ('off', 'стоп', 'нет'):
+        if subscribed_group is None:
+            update.message.reply_text("Вы не подписаны на утреннюю рассылку расписания.")
+            return
+        unsubscribe_digest(user_id)
+        update.message.reply_text("Утренняя рассылка расписания отключена.")
+        return
+    if context.args and context.args[0].lower() in ('status', 'статус'):
+        if subscribed_group is None:
+            update.message.reply_text("Вы не подписаны на утреннюю рассылку. Подписаться: /digest")
+        else:
+            update.message.reply_text(
+                f"Вы подписаны на расписание группы {subscribed_group.replace('Группа', '').strip()}, "
+                f"рассылка в {DIGEST_TIME.strftime('%H:%M')}. Отключить: /digest off"
+            )
+        return
+
+    group_name = current_group(update, context)
+    if not group_name:
+        update.message.reply_text("Сначала выберите группу через /start, затем повторите /digest.")
+        return
+    if group_name == subscribed_group:
+        update.message.reply_text(
+            f"Вы уже подписаны на расписание группы {group_name.replace('Группа', '').strip()}. "
+            f"Отключить: /digest off"
+        )
+        return
+
+    subscribe_digest(user_id, group_name)
+    update.message.reply_text(
+        f"Каждое утро в {DIGEST_TIME.strftime('%H:%M')} буду присылать расписание группы "
+        f"{group_name.replace('Группа', '').strip()}. Отключить: /digest off"
+    )
+
+def daily_digest_job(context: CallbackContext):
+    # Рассылка идёт через общий исполнитель рассылок и не занимает поток планировщика
+    broadcast_executor.submit(
+        run_digest, context.bot, current_schedule, schedule_history, get_digest_subscribers(),
+        datetime.now(DIGEST_TIMEZONE).date(), mark_users_blocked
+    )
+
+def now_command(update: Update, context: CallbackContext):
+    schedule_state = current_schedule
+    moment = datetime.now(LOCAL_TIMEZONE).replace(tzinfo=None)
+
+    # /now <фамилия> - по преподавателю, иначе по выбранной или последней группе пользователя
+    if context.args:
+        key = teacher_key(' '.join(context.args))
+        time_index = schedule_state.teacher_times.get(key)
+        title = f"Преподаватель {' '.join(context.args)}"
+    else:
+        group_name = current_group(update, context)
+        if not group_name:
+            update.message.reply_text("Сначала выберите группу через /start или укажите фамилию: /now <Фамилия>")
+            return
+        time_index = schedule_state.group_times.get(group_name)
+        title = f"Группа {group_name.replace('Группа', '').strip()}"
+
+    if time_index is None:
+        update.message.reply_text("Занятий не найдено.")
+        return
+
+    current, upcoming = time_index.current_and_next(moment)
+    text = f"{title}\n\n"
+    text += f"<b>Сейчас:</b> {current[1]}\n" if current else "<b>Сейчас:</b> занятия нет\n"
+    text += f"<b>Далее ({upcoming[0]}):</b> {upcoming[1]}" if upcoming else "<b>Далее:</b> занятий на этой неделе больше нет"
+    update.message.reply_text(text, parse_mode='HTML')
+
+def history_sessions_text(title, sessions):
+    lines = [f"<b>{title}</b>"]
+    for _, group_name, class_session in sessions:
+        formatted_session = format_class_session(class_session)
+        if formatted_session:
+            lines.append(f"{group_name.replace('Группа', '').strip()}: {formatted_session}")
+    return "\n".join(lines) if len(lines) > 1 else f"<b>{title}</b>\nЗанятий нет."
+
+def date_command(update: Update, context: CallbackContext):
+    args = context.args or []
+    # /date <дд.мм> - расписание выбранной группы на дату любой сохранённой недели, /date <дд.мм> <фамилия> - преподавателя
+    # Дата из текущего листа берётся такой, какой её видят остальные команды
+    day_date = (schedule_date(current_schedule, args[0], datetime.now(LOCAL_TIMEZONE).date())
+                if args and re.fullmatch(r'\d{1,2}\.\d{1,2}', args[0]) else None)
+    if day_date is None:
+        update.message.reply_text("Введите команду в формате: /date <дд.мм> [Фамилия преподавателя]")
+        return
+
+    if len(args) > 1:
+        # Фамилию уточняем по текущему расписанию, преподавателя прошлых недель ищем как введено
+        matches = teacher_results.lookup(current_schedule, ' '.join(args[1:]))
+        key = matches[0][0] if len(matches) == 1 else teacher_key(' '.join(args[1:]))
+        sessions = schedule_history.teacher_sessions(key, day_date, day_date)
+        text = history_sessions_text(f"{key.capitalize()}, {day_date:%d.%m.%Y}", sessions)
+        update.message.reply_text(text, parse_mode='HTML')
+        return
+
+    group_name = current_group(update, context)
+    if not group_name:
+        update.message.reply_text("Сначала выберите группу через /start или укажите фамилию: /date <дд.мм> <Фамилия>")
+        return
+    day_schedule = schedule_history.day(group_name, day_date)
+    if day_schedule is None:
+        update.message.reply_text(f"Расписания группы на {day_date:%d.%m.%Y} нет.")
+        return
+    update.message.reply_text(f"Группа {group_name.replace('Группа', '').strip()}\n\n" + render_day(day_schedule),
+                              parse_mode='HTML')
+
+def room_command(update: Update, context: CallbackContext):
+    args = context.args or []
+    # /room <аудитория> [дд.мм] - занятия в аудитории за день, по умолчанию сегодня
+    today = datetime.now(LOCAL_TIMEZONE).date()
+    if args and re.fullmatch(r'\d{1,2}\.\d{1,2}', args[-1]):
+        day_date = schedule_date(current_schedule, args[-1], today)
+        args = args[:-1]
+    else:
+        day_date = today
+    if not args or day_date is None:
+        update.message.reply_text("Введите команду в формате: /room <аудитория> [дд.мм]")
+        return
+    auditorium = ' '.join(args)
+    sessions = schedule_history.room_sessions(auditorium, day_date, day_date)
+    update.message.reply_text(history_sessions_text(f"Аудитория {auditorium}, {day_date:%d.%m.%Y}", sessions),
+                              parse_mode='HTML')
+
+def free_rooms_command(update: Update, context: CallbackContext):
+    room_index = current_schedule.room_index
+    now = datetime.now(LOCAL_TIMEZONE)
+    args = context.args or []
+
+    # /free_rooms [день] [пара или диапазон пар, например 3 или 3-5]
+    has_day = bool(args) and not re.fullmatch(r'\d+(-\d+)?', args[0])
+    day_arg = args[0] if has_day else "сегодня"
+    slot_args = args[1:] if has_day else args
+    day_schedule = room_index.find_day(day_arg, now.date())
+    if day_schedule is None:
+        update.message.reply_text("В этот день занятий нет. Формат: /free_rooms [день] [пара], например /free_rooms вт 3-5")
+        return
+    slot_times = room_index.slot_times[day_schedule.name]
+
+    if slot_args:
+        try:
+            first, _, last = slot_args[0].partition('-')
+            first_slot = int(first) - 1
+            slot_count = int(last) - first_slot if last else 1
+        except ValueError:
+            update.message.reply_text("Номер пары указывается числом, например /free_rooms вт 3 или /free_rooms вт 3-5")
+            return
+    elif day_schedule.date == now.strftime("%d.%m"):
+        # Сегодня по умолчанию берём текущую или ближайшую пару
+        first_slot = next((i for i, slot_time in enumerate(slot_times) if parse_time_range(slot_time)[1] > now.time()),
+                          len(slot_times))
+        slot_count = 1
+    else:
+        first_slot, slot_count = 0, 1
+
+    if not slot_args and first_slot == len(slot_times):
+        update.message.reply_text("Пары на сегодня закончились.")
+        return
+    if first_slot < 0 or slot_count < 1 or first_slot + slot_count > len(slot_times):
+        update.message.reply_text(f"Такой пары нет: в этот день пар {len(slot_times)}.")
+        return
+
+    rooms = room_index.free_rooms(day_schedule.name, first_slot, slot_count)
+    slots = f"{first_slot + 1}" if slot_count == 1 else f"{first_slot + 1}-{first_slot + slot_count}"
+    period = f"{slot_times[first_slot].split('-')[0].strip()}-{slot_times[first_slot + slot_count - 1].split('-')[-1].strip()}"
+    text = f"<b>{day_schedule.name}</b>, пара {slots} ({period})\n"
+    text += "Свободные аудитории: " + ", ".join(rooms) if rooms else "Свободных аудиторий нет."
+    update.message.reply_text(text, parse_mode='HTML')
+
 def day_sort_key(day):
     # Словарь для определения порядка дней недели
     week_days_order = {
@@ -295,52 +680,148 @@ def day_sort_key(day):
     # Возвращаем кортеж с порядковым номером дня недели и датой
     return (week_days_order[day_name], date)    
 
+def teacher_days_markup(key, teacher_days):
+    """Day selection keyboard of one teacher; buttons carry the surname, so any user can press them."""
+    # Создание кнопок с датами, отсортированных по порядку дней недели
+    keyboard = []
+    sorted_days = sorted(teacher_days.keys(), key=day_sort_key)
+    for day_name in sorted_days:
+        # Создаем кнопку для каждого дня
+        button = InlineKeyboardButton(day_name, callback_data=f"show_day_{key}_{day_name.rsplit(', ', 1)[-1]}")
+        keyboard.append([button])
+    return InlineKeyboardMarkup(keyboard) if keyboard else None
+
 def search_teacher(update: Update, context: CallbackContext):
-    global teacher_days
     text = ' '.join(context.args)
     
     if not text:
         update.message.reply_text("Для этого преподавателя занятий не найдено.")
         return
     
-    teacher_days = find_teacher_days(schedule_data, text)
+    matches = teacher_results.lookup(current_schedule, text)
 
-    # Создание кнопок с датами, отсортированных по порядку дней недели
-    keyboard = []
-    sorted_days = sorted(teacher_days.keys(), key=day_sort_key)
-    for day_name in sorted_days:
-        # Создаем кнопку для каждого дня
-        button = InlineKeyboardButton(day_name, callback_data=f"show_day_{day_name}")
-        keyboard.append([button])
+    # Если подходит несколько преподавателей, сначала просим выбрать нужного
+    if len(matches) > 1:
+        keyboard = [[InlineKeyboardButton(key.capitalize(), callback_data=f"teacher_{key}")] for key, _ in matches]
+        update.message.reply_text("Найдено несколько преподавателей, выберите:", reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+
+    reply_markup = teacher_days_markup(*matches[0]) if matches else None
     
     # Если нет занятий, отправляем сообщение об этом
-    if not keyboard:
+    if not reply_markup:
         update.message.reply_text("Для этого преподавателя занятий не найдено.")
         return
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    update.message.reply_text("Выберите день:", reply_markup=reply_markup)
+    update.message.reply_text(f"Преподаватель {matches[0][0].capitalize()}. Выберите день:", reply_markup=reply_markup)
 
-    
-    
-def main():
-    global schedule_data
-    schedule_data = load_schedule(SCHEDULE_FILE)
-    updater = Updater("6668495629:AAGlmeOCtw9dQxSXr31UugK9bLGfsimw-Xg", use_context=True)
-    dispatcher = updater.dispatcher
+def send_calendar(update, schedule_state, cache_key, file_name, lines):
+    """Send an .ics once per schedule version; afterwards Telegram's file_id is resent without an upload."""
+    file_id = schedule_state.ical_files.get(cache_key)
+    if file_id:
+        update.message.reply_document(file_id)
+        return
+    # Календарь пишется построчно во временный файл, в памяти остаётся только его небольшая часть
+    with tempfile.SpooledTemporaryFile(max_size=1 << 20) as f:
+        write_calendar(lines, f)
+        f.seek(0)
+        message = update.message.reply_document(f, filename=file_name,
+                                                caption="Импортируйте файл в календарь телефона или Google Календарь.")
+    schedule_state.ical_files[cache_key] = message.document.file_id
+
+def ical_command(update: Update, context: CallbackContext):
+    schedule_state = current_schedule
+    text = ' '.join(context.args)
+    if text:
+        found = schedule_state.group_index.search(text)
+        # Точное совпадение названия выбираем сразу, иначе просим уточнить
+        exact = [group for group in found if normalize_string(group.replace('Группа', '')) == normalize_string(text)]
+        if len(found) > 1 and not exact:
+            update.message.reply_text("Найдено несколько групп, уточните название:\n" +
+                                      "\n".join(group.replace('Группа', '').strip() for group in found[:10]))
+            return
+        group_name = exact[0] if exact else (found[0] if found else None)
+    else:
+        group_name = current_group(update, context)
+    if not group_name or group_name not in schedule_state.schedule_data:
+        update.message.reply_text("Группа не найдена. Введите команду в формате: /ical <группа>")
+        return
+
+    title = group_name.replace('Группа', '').strip()
+    send_calendar(update, schedule_state, ('group', group_name), f"{title}.ics",
+                  group_calendar(schedule_state, group_name))
 
-    dispatcher.add_handler(CommandHandler('start', start))
-    dispatcher.add_handler(CallbackQueryHandler(button))
-    dispatcher.add_handler(MessageHandler(Filters.document, update_schedule))
-    dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, search_group_result))
-    dispatcher.add_handler(CommandHandler('list_users', list_users))
-    dispatcher.add_handler(CommandHandler("message", message_all_users, pass_args=True))
-    dispatcher.add_handler(CommandHandler("toggle_message", toggle_message_command))
+def ical_teacher_command(update: Update, context: CallbackContext):
+    schedule_state = current_schedule
+    text = ' '.join(context.args)
+    if not text:
+        update.message.reply_text("Введите команду в формате: /ical_teacher <Фамилия>")
+        return
+    matches = teacher_results.lookup(schedule_state, text)
+    if not matches:
+        update.message.reply_text("Для этого преподавателя занятий не найдено.")
+        return
+    if len(matches) > 1:
+        update.message.reply_text("Найдено несколько преподавателей, уточните фамилию: " +
+                                  ", ".join(key.capitalize() for key, _ in matches))
+        return
 
-    dispatcher.add_handler(CommandHandler("search_teacher", search_teacher, pass_args=True))
+    key = matches[0][0]
+    send_calendar(update, schedule_state, ('teacher', key), f"{key.capitalize()}.ics",
+                  teacher_calendar(schedule_state, key))
+
+def build_updater(token=BOT_TOKEN, base_url=BOT_API_URL, base_file_url=BOT_FILE_URL, workers=UPDATE_WORKERS):
+    """Updater with all handlers registered.
+
+    Handlers run with run_async: each update goes to the dispatcher pool of `workers` threads,
+    so a slow upload or /message never holds up other users' button presses.
+    """
+    updater = Updater(token, base_url=base_url, base_file_url=base_file_url, workers=workers, use_context=True)
+    dispatcher = updater.dispatcher
+
+    def add_command(command, name, callback, **kwargs):
+        dispatcher.add_handler(CommandHandler(command, timed_handler(name, callback), run_async=True, **kwargs))
+
+    # Каждый обработчик обёрнут в замер времени, метрики доступны через /stats и локальный /metrics
+    add_command('start', 'start', start)
+    dispatcher.add_handler(CallbackQueryHandler(timed_handler('button', button, kind=callback_kind), run_async=True))
+    dispatcher.add_handler(MessageHandler(Filters.document, timed_handler('update_schedule', update_schedule), run_async=True))
+    dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, timed_handler('search_group_result', search_group_result),
+                                          run_async=True))
+    add_command('list_users', 'list_users', list_users)
+    add_command("message", 'message', message_all_users, pass_args=True)
+    add_command("toggle_message", 'toggle_message', toggle_message_command)
+    add_command("cache_stats", 'cache_stats', cache_stats)
+    add_command("stats", 'stats', stats_command)
+    add_command("profile", 'profile', profile_command, pass_args=True)
+    add_command("memtrace", 'memtrace', memtrace_command)
+    add_command("digest", 'digest', digest_command, pass_args=True)
+    add_command("now", 'now', now_command, pass_args=True)
+    add_command("free_rooms", 'free_rooms', free_rooms_command, pass_args=True)
+    add_command("date", 'date', date_command, pass_args=True)
+    add_command("room", 'room', room_command, pass_args=True)
+
+    add_command("search_teacher", 'search_teacher', search_teacher, pass_args=True)
+    add_command("ical", 'ical', ical_command, pass_args=True)
+    add_command("ical_teacher", 'ical_teacher', ical_teacher_command, pass_args=True)
     
+    updater.job_queue.run_daily(daily_digest_job, DIGEST_TIME, days=DIGEST_DAYS, name='daily_digest')
+    return updater
+
+def main():
+    global current_schedule
+    init_db()
+    current_schedule = load_schedule(SCHEDULE_FILE)
+    warm_render_cache(current_schedule)
+    import_history(current_schedule)
+    start_write_behind()
+    start_metrics_server()
+    updater = build_updater()
+
     updater.start_polling()
     updater.idle()
+    flush_pending_users()
+    shutdown_parse_executor()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
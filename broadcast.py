@@ -0,0 +1,155 @@
+# File path: broadcast.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from telegram.error import BadRequest, RetryAfter, TimedOut, NetworkError, Unauthorized
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и не чаще 1 сообщения в секунду в один чат
+GLOBAL_RATE = 25
+GLOBAL_BURST = 25
+PER_CHAT_INTERVAL = 1.0
+SENDER_WORKERS = 8
+MAX_ATTEMPTS = 4
+# Как часто обновляется сообщение с прогрессом рассылки (секунды)
+PROGRESS_INTERVAL = 3.0
+
+class TokenBucket:
+    """Blocking token bucket shared by all sender threads."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Flood wait applies to the whole bot, so every sender stops until it passes."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+class ChatLimiter:
+    """Keeps at least PER_CHAT_INTERVAL between two messages to the same chat."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_sent = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, chat_id):
+        with self.lock:
+            now = time.monotonic()
+            ready_at = self.last_sent.get(chat_id, 0.0) + self.interval
+            send_at = max(now, ready_at)
+            self.last_sent[chat_id] = send_at
+        if send_at > now:
+            time.sleep(send_at - now)
+
+# Лимиты общие для всех рассылок процесса: несколько запусков подряд не превышают скорость вместе
+shared_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+shared_chat_limiter = ChatLimiter(PER_CHAT_INTERVAL)
+
+class Broadcast:
+    """One /message run: sends text to every user and reports progress in a single edited message.
+
+    bot only needs send_message(chat_id, text, parse_mode=...); status_message only needs edit_text(text),
+    so a fake bot that records calls is enough to run it offline.
+    """
+
+    def __init__(self, bot, user_ids, text, status_message=None, mark_blocked=None,
+                 bucket=None, chat_limiter=None, workers=SENDER_WORKERS, parse_mode=None):
+        self.bot = bot
+        self.user_ids = list(user_ids)
+        self.text = text
+        self.parse_mode = parse_mode
+        self.status_message = status_message
+        self.mark_blocked = mark_blocked
+        self.bucket = bucket or shared_bucket
+        self.chat_limiter = chat_limiter or shared_chat_limiter
+        self.workers = workers
+        self.sent = 0
+        self.blocked = []
+        self.failed = []
+        self.lock = threading.Lock()
+        self.last_progress = 0.0
+
+    def send_one(self, user_id):
+        for attempt in range(MAX_ATTEMPTS):
+            self.bucket.acquire()
+            self.chat_limiter.acquire(user_id)
+            try:
+                self.bot.send_message(user_id, self.text, parse_mode=self.parse_mode)
+                return 'sent'
+            except RetryAfter as e:
+                self.bucket.pause(e.retry_after)
+            except Unauthorized:
+                return 'blocked'
+            except BadRequest as e:
+                if 'chat not found' in str(e).lower():
+                    return 'blocked'
+                return 'failed'
+            except (TimedOut, NetworkError):
+                time.sleep(2 ** attempt)
+            except Exception:
+                return 'failed'
+        return 'failed'
+
+    def record(self, user_id, result):
+        with self.lock:
+            if result == 'sent':
+                self.sent += 1
+            elif result == 'blocked':
+                self.blocked.append(user_id)
+            else:
+                self.failed.append(user_id)
+            done = self.sent + len(self.blocked) + len(self.failed)
+            now = time.monotonic()
+            if now - self.last_progress < PROGRESS_INTERVAL:
+                return
+            self.last_progress = now
+        self.report(f"Рассылка: {done}/{len(self.user_ids)}...")
+
+    def report(self, text):
+        if self.status_message is None:
+            return
+        try:
+            self.status_message.edit_text(text)
+        except Exception as e:
+            print(f"Не удалось обновить статус рассылки: {e}")
+
+    def run(self):
+        started = time.monotonic()
+        self.last_progress = started
+
+        def worker(user_id):
+            self.record(user_id, self.send_one(user_id))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='broadcast') as executor:
+            list(executor.map(worker, self.user_ids))
+
+        if self.blocked and self.mark_blocked:
+            self.mark_blocked(self.blocked)
+
+        elapsed = time.monotonic() - started
+        self.report(
+            f"Рассылка завершена за {elapsed:.0f} с: доставлено {self.sent}, "
+            f"заблокировали бота {len(self.blocked)}, ошибок {len(self.failed)}."
+        )
+        return self
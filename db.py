@@ -1,58 +1,523 @@
 # File path: db.py
+import atexit
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from metrics import timed_db
 
-conn = sqlite3.connect('users.db', check_same_thread=False)
-cursor = conn.cursor()
+DB_FILE = 'users.db'
+# Как часто отложенные изменения пользователей записываются в базу (секунды)
+FLUSH_INTERVAL = 2.0
+# Сколько пользователей держим в кеше get_user
+USER_CACHE_SIZE = 4096
+# Сколько последних групп пользователя помним
+RECENT_GROUPS_LIMIT = 3
+# Версия схемы в PRAGMA user_version; 1 - группы пользователей вынесены в user_groups
+SCHEMA_VERSION = 1
 
-cursor.execute('''
+# Запросы задаются константами: sqlite3 кеширует подготовленные выражения на соединение по тексту SQL
+SQL_CREATE_USERS = '''
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY,
     telegram_login TEXT,
-    recent_groups TEXT  -- Строка с последними группами, разделенными запятыми
+    blocked INTEGER NOT NULL DEFAULT 0  -- Пользователь заблокировал бота, рассылка его пропускает
 )
-''')
-conn.commit()
+'''
+SQL_CREATE_USER_GROUPS = '''
+CREATE TABLE IF NOT EXISTS user_groups (
+    user_id INTEGER NOT NULL,
+    group_name TEXT NOT NULL,
+    last_used_at REAL NOT NULL,  -- Время последнего выбора группы (unix time)
+    PRIMARY KEY (user_id, group_name)
+)
+'''
+SQL_CREATE_USER_GROUPS_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_user_groups_user ON user_groups (user_id, last_used_at)',
+    'CREATE INDEX IF NOT EXISTS idx_user_groups_group ON user_groups (group_name, user_id)',
+]
+# Подписки на утреннюю рассылку расписания: у пользователя не больше одной группы
+SQL_CREATE_DIGEST_SUBSCRIPTIONS = '''
+CREATE TABLE IF NOT EXISTS digest_subscriptions (
+    user_id INTEGER PRIMARY KEY,
+    group_name TEXT NOT NULL
+)
+'''
+SQL_CREATE_DIGEST_INDEX = 'CREATE INDEX IF NOT EXISTS idx_digest_group ON digest_subscriptions (group_name)'
+# История расписаний: занятия всех загруженных недель. Даты хранятся в ISO (ГГГГ-ММ-ДД), поэтому диапазон дат -
+# это диапазон ключей индекса. Первичный ключ (группа, дата, номер пары) сразу служит индексом (group, date)
+SQL_CREATE_SCHEDULE_WEEKS = '''
+CREATE TABLE IF NOT EXISTS schedule_weeks (
+    week_start TEXT PRIMARY KEY,  -- Понедельник недели
+    imported_at REAL NOT NULL
+)
+'''
+SQL_CREATE_SCHEDULE_SESSIONS = '''
+CREATE TABLE IF NOT EXISTS schedule_sessions (
+    group_name TEXT NOT NULL,
+    day_date TEXT NOT NULL,
+    position INTEGER NOT NULL,  -- Номер пары в дне, с нуля
+    weekday TEXT NOT NULL,
+    time TEXT NOT NULL,
+    discipline TEXT NOT NULL,
+    type_of_class TEXT NOT NULL,
+    teacher TEXT NOT NULL,
+    auditorium TEXT NOT NULL,
+    PRIMARY KEY (group_name, day_date, position)
+) WITHOUT ROWID
+'''
+# Преподаватели и аудитории занятий (у подгрупп их несколько), ссылаются на занятие по его ключу
+SQL_CREATE_SCHEDULE_TEACHERS = '''
+CREATE TABLE IF NOT EXISTS schedule_teachers (
+    teacher_key TEXT NOT NULL,
+    day_date TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (teacher_key, day_date, group_name, position)
+) WITHOUT ROWID
+'''
+SQL_CREATE_SCHEDULE_ROOMS = '''
+CREATE TABLE IF NOT EXISTS schedule_rooms (
+    auditorium TEXT NOT NULL,
+    day_date TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (auditorium, day_date, group_name, position)
+) WITHOUT ROWID
+'''
+SQL_CREATE_SCHEDULE_SESSIONS_INDEX = 'CREATE INDEX IF NOT EXISTS idx_schedule_sessions_date ON schedule_sessions (day_date)'
+SQL_ADD_BLOCKED = 'ALTER TABLE users ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0'
+# Любое действие пользователя снимает отметку о блокировке
+SQL_UPSERT_USER = '''
+INSERT INTO users (id, telegram_login) VALUES (?, ?)
+ON CONFLICT(id) DO UPDATE SET telegram_login = excluded.telegram_login, blocked = 0
+'''
+SQL_DELETE_USER_GROUPS = 'DELETE FROM user_groups WHERE user_id = ?'
+SQL_INSERT_USER_GROUP = 'INSERT INTO user_groups (user_id, group_name, last_used_at) VALUES (?, ?, ?)'
+SQL_GET_USER = 'SELECT id, telegram_login FROM users WHERE id = ?'
+SQL_GET_USER_GROUPS = 'SELECT group_name, last_used_at FROM user_groups WHERE user_id = ? ORDER BY last_used_at'
+SQL_GROUP_AUDIENCE = '''
+SELECT g.user_id FROM user_groups g JOIN users u ON u.id = g.user_id
+WHERE g.group_name = ? AND u.blocked = 0
+'''
+# Строка групп пользователя для отображения в списках
+SQL_RECENT_GROUPS_TEXT = '''(SELECT group_concat(group_name, ',') FROM
+    (SELECT group_name FROM user_groups WHERE user_id = users.id ORDER BY last_used_at))'''
+SQL_ALL_USERS = f"SELECT telegram_login, COALESCE({SQL_RECENT_GROUPS_TEXT}, '') FROM users"
+SQL_ALL_USER_IDS = 'SELECT id FROM users'
+SQL_BROADCAST_USER_IDS = 'SELECT id FROM users WHERE blocked = 0'
+SQL_MARK_BLOCKED = 'UPDATE users SET blocked = 1 WHERE id = ?'
+SQL_USERS_PAGE = f"SELECT id, telegram_login, COALESCE({SQL_RECENT_GROUPS_TEXT}, '') FROM users WHERE id > ? ORDER BY id LIMIT ?"
+SQL_USER_COUNT = 'SELECT COUNT(*) FROM users'
+SQL_POPULAR_GROUPS = 'SELECT group_name FROM user_groups GROUP BY group_name ORDER BY COUNT(*) DESC LIMIT ?'
+SQL_SUBSCRIBE_DIGEST = '''
+INSERT INTO digest_subscriptions (user_id, group_name) VALUES (?, ?)
+ON CONFLICT(user_id) DO UPDATE SET group_name = excluded.group_name
+'''
+SQL_UNSUBSCRIBE_DIGEST = 'DELETE FROM digest_subscriptions WHERE user_id = ?'
+SQL_GET_DIGEST_SUBSCRIPTION = 'SELECT group_name FROM digest_subscriptions WHERE user_id = ?'
+SQL_DIGEST_SUBSCRIBERS = '''
+SELECT d.group_name, d.user_id FROM digest_subscriptions d JOIN users u ON u.id = d.user_id
+WHERE u.blocked = 0 ORDER BY d.group_name
+'''
+SQL_SESSION_COLUMNS = 's.group_name, s.day_date, s.weekday, s.time, s.discipline, s.type_of_class, s.teacher, s.auditorium'
+SQL_UPSERT_SCHEDULE_WEEK = '''
+INSERT INTO schedule_weeks (week_start, imported_at) VALUES (?, ?)
+ON CONFLICT(week_start) DO UPDATE SET imported_at = excluded.imported_at
+'''
+# Повторная загрузка недели заменяет её целиком. Таблицы связей при этом просматриваются полностью:
+# загрузка раз в неделю, а индекс по дате в них нужен был бы только ради неё
+SQL_DELETE_SCHEDULE_DAYS = [
+    'DELETE FROM schedule_sessions WHERE day_date BETWEEN ? AND ?',
+    'DELETE FROM schedule_teachers WHERE day_date BETWEEN ? AND ?',
+    'DELETE FROM schedule_rooms WHERE day_date BETWEEN ? AND ?',
+]
+SQL_INSERT_SCHEDULE_SESSION = 'INSERT INTO schedule_sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+SQL_INSERT_SCHEDULE_TEACHER = 'INSERT OR IGNORE INTO schedule_teachers VALUES (?, ?, ?, ?)'
+SQL_INSERT_SCHEDULE_ROOM = 'INSERT OR IGNORE INTO schedule_rooms VALUES (?, ?, ?, ?)'
+SQL_SCHEDULE_WEEKS = 'SELECT week_start FROM schedule_weeks ORDER BY week_start'
+SQL_SCHEDULE_RANGE = f'''
+SELECT {SQL_SESSION_COLUMNS} FROM schedule_sessions s
+WHERE s.day_date BETWEEN ? AND ? ORDER BY s.group_name, s.day_date, s.position
+'''
+SQL_GROUP_DAY = f'''
+SELECT {SQL_SESSION_COLUMNS} FROM schedule_sessions s
+WHERE s.group_name = ? AND s.day_date = ? ORDER BY s.position
+'''
+SQL_TEACHER_RANGE = f'''
+SELECT {SQL_SESSION_COLUMNS} FROM schedule_teachers t
+JOIN schedule_sessions s ON s.group_name = t.group_name AND s.day_date = t.day_date AND s.position = t.position
+WHERE t.teacher_key = ? AND t.day_date BETWEEN ? AND ? ORDER BY t.day_date, s.position, s.group_name
+'''
+SQL_ROOM_RANGE = f'''
+SELECT {SQL_SESSION_COLUMNS} FROM schedule_rooms r
+JOIN schedule_sessions s ON s.group_name = r.group_name AND s.day_date = r.day_date AND s.position = r.position
+WHERE r.auditorium = ? AND r.day_date BETWEEN ? AND ? ORDER BY r.day_date, s.position, s.group_name
+'''
 
-def add_or_update_user(user_id, telegram_login, selected_group):
-    """Добавление или обновление пользователя в базе данных с тремя последними группами."""
-    user_info = get_user(user_id)
-    if user_info:
-        recent_groups = user_info[2] or ""
-        groups_list = recent_groups.split(",") if recent_groups else []
-
-        # Удаляем все предыдущие вхождения этой группы в списке, убеждаемся, что group не None
-        groups_list = [group for group in groups_list if group != selected_group and group is not None]
-
-        # Добавляем выбранную группу в конец списка, если она не None
-        if selected_group:
-            groups_list.append(selected_group)
-        
-        # Оставляем только последние три группы
-        groups_list = groups_list[-3:]
-
-        recent_groups = ",".join(groups_list)
-    else:
-        # Если selected_group None, установим пустую строку
-        recent_groups = selected_group if selected_group else ""
-
-    cursor.execute('''
-    INSERT INTO users (id, telegram_login, recent_groups) VALUES (?, ?, ?)
-    ON CONFLICT(id) DO UPDATE SET telegram_login = excluded.telegram_login, recent_groups = excluded.recent_groups
-    ''', (user_id, telegram_login, recent_groups))
+# У каждого потока (воркеры диспетчера, фоновый сброс, загрузка расписания) своё соединение
+local = threading.local()
+
+# Все записи идут через один поток-писатель: обработчики читают через WAL и не ждут блокировку записи SQLite,
+# а писатели не конкурируют между собой
+writer_thread = None
+
+def remember_writer_thread():
+    global writer_thread
+    writer_thread = threading.current_thread()
+
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer', initializer=remember_writer_thread)
+
+def run_db_write(write, *args):
+    """Выполнить запись в потоке-писателе и дождаться результата."""
+    if threading.current_thread() is writer_thread:
+        return write(*args)
+    try:
+        future = db_executor.submit(write, *args)
+    except RuntimeError:
+        # Интерпретатор завершается и пул уже остановлен: последний сброс из atexit выполняем на месте
+        return write(*args)
+    return future.result()
+
+def get_connection():
+    """Соединение текущего потока, создаётся при первом обращении."""
+    conn = getattr(local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=10, cached_statements=64)
+        # WAL: чтения не ждут записи, а коммит не требует fsync на каждое нажатие кнопки
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        local.conn = conn
+    return conn
+
+def migrate_recent_groups(conn):
+    """Перенести строки users.recent_groups ("г1,г2,г3") в таблицу user_groups и удалить столбец."""
+    now = time.time()
+    rows = []
+    for user_id, recent_groups in conn.execute('SELECT id, recent_groups FROM users').fetchall():
+        groups_list = [group for group in (recent_groups or "").split(",") if group]
+        # В старых строках группы могли повторяться; берём последние вхождения, самая новая группа - последняя
+        latest_first = list(dict.fromkeys(reversed(groups_list)))[:RECENT_GROUPS_LIMIT]
+        for position, group in enumerate(latest_first):
+            rows.append((user_id, group, now - position))
+    conn.executemany(SQL_INSERT_USER_GROUP, rows)
+    try:
+        conn.execute('ALTER TABLE users DROP COLUMN recent_groups')
+    except sqlite3.OperationalError:
+        # SQLite старше 3.35 не умеет удалять столбцы; старый столбец просто больше не используется
+        pass
+
+def init_schema(conn):
+    conn.execute(SQL_CREATE_USERS)
+    conn.execute(SQL_CREATE_USER_GROUPS)
+    for sql in SQL_CREATE_USER_GROUPS_INDEXES:
+        conn.execute(sql)
+    conn.execute(SQL_CREATE_DIGEST_SUBSCRIPTIONS)
+    conn.execute(SQL_CREATE_DIGEST_INDEX)
+    conn.execute(SQL_CREATE_SCHEDULE_WEEKS)
+    conn.execute(SQL_CREATE_SCHEDULE_SESSIONS)
+    conn.execute(SQL_CREATE_SCHEDULE_TEACHERS)
+    conn.execute(SQL_CREATE_SCHEDULE_ROOMS)
+    conn.execute(SQL_CREATE_SCHEDULE_SESSIONS_INDEX)
+    columns = [column[1] for column in conn.execute('PRAGMA table_info(users)')]
+    # Базы, созданные до появления столбца blocked
+    if 'blocked' not in columns:
+        conn.execute(SQL_ADD_BLOCKED)
+    if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+        if 'recent_groups' in columns:
+            migrate_recent_groups(conn)
+        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
 
+# Число пользователей считается один раз при запуске и дальше увеличивается при добавлении новых
+user_count = 0
+
+def init_db():
+    """Создать или обновить схему и посчитать пользователей. Вызывается при запуске, а не при импорте:
+    процессы, которые только импортируют модули (процесс разбора xlsx), не открывают users.db."""
+    global user_count
+    conn = get_connection()
+    init_schema(conn)
+    user_count = conn.execute(SQL_USER_COUNT).fetchone()[0]
+
+# Write-behind: изменения пользователей, ещё не записанные в базу.
+# Запись пользователя - (user_id, telegram_login, ((группа, время выбора), ...)), группы от старых к новым
+pending_users = {}  # user_id -> запись
+flushing_users = {}  # пачка, которая прямо сейчас записывается в базу
+# Номер изменения пользователя: растёт при каждом add_or_update_user. Чтения из базы идут без блокировки,
+# и прочитанная запись кладётся в кеш, только если за время чтения номер не изменился
+user_generations = {}  # user_id -> номер изменения
+pending_lock = threading.Lock()
+flush_lock = threading.Lock()
+flush_thread = None
+
+# LRU-кеш записей пользователей из базы; None тоже кешируется (пользователя нет)
+user_cache = OrderedDict()
+user_cache_lock = threading.Lock()
+
+def cache_user(user_id, record):
+    with user_cache_lock:
+        user_cache[user_id] = record
+        user_cache.move_to_end(user_id)
+        if len(user_cache) > USER_CACHE_SIZE:
+            user_cache.popitem(last=False)
+
+def invalidate_user(user_id):
+    with user_cache_lock:
+        user_cache.pop(user_id, None)
+
+def read_user_record(user_id):
+    conn = get_connection()
+    row = conn.execute(SQL_GET_USER, (user_id,)).fetchone()
+    if row is None:
+        return None
+    return (row[0], row[1], tuple(conn.execute(SQL_GET_USER_GROUPS, (user_id,)).fetchall()))
+
+def get_user_record(user_id):
+    """Запись пользователя из кеша, буфера или базы."""
+    while True:
+        with user_cache_lock:
+            if user_id in user_cache:
+                user_cache.move_to_end(user_id)
+                return user_cache[user_id]
+        with pending_lock:
+            pending = pending_users.get(user_id) or flushing_users.get(user_id)
+            if pending:
+                return pending
+            generation = user_generations.get(user_id, 0)
+        # Запрос к базе выполняется без блокировок: промахи кеша в разных потоках не ждут друг друга
+        record = read_user_record(user_id)
+        with pending_lock:
+            if user_generations.get(user_id, 0) == generation:
+                cache_user(user_id, record)
+                return record
+        # Пока шло чтение, пользователь изменился: прочитанная запись может быть устаревшей, читаем заново
+
+@timed_db
+def add_or_update_user(user_id, telegram_login, selected_group):
+    """Добавление или обновление пользователя в базе данных с тремя последними группами.
+
+    Изменение сначала попадает в память и записывается в базу пачкой при следующем сбросе.
+    """
+    global user_count
+    while True:
+        with pending_lock:
+            generation = user_generations.get(user_id, 0)
+        record = get_user_record(user_id)
+        with pending_lock:
+            # Запись успел изменить другой поток (два нажатия одного пользователя) - повторяем с его данными
+            if user_generations.get(user_id, 0) != generation:
+                continue
+            if record is None:
+                user_count += 1
+                recent = ()
+            else:
+                recent = record[2]
+
+            if selected_group:
+                # Повторный выбор группы только обновляет время; остаются три последние группы
+                recent = tuple(item for item in recent if item[0] != selected_group) + ((selected_group, time.time()),)
+                recent = recent[-RECENT_GROUPS_LIMIT:]
+
+            # Повторные нажатия одного пользователя до сброса схлопываются в одну запись
+            pending_users[user_id] = (user_id, telegram_login, recent)
+            user_generations[user_id] = generation + 1
+            invalidate_user(user_id)
+            return
+
+@timed_db
+def flush_pending_users():
+    """Записать накопленные изменения пользователей одной транзакцией."""
+    return run_db_write(write_pending_users)
 
+def write_pending_users():
+    global pending_users, flushing_users
+    with flush_lock:
+        with pending_lock:
+            if not pending_users:
+                return 0
+            # Пока идёт запись, чтения берут пачку из flushing_users, а новые нажатия копятся в pending_users
+            flushing_users, pending_users = pending_users, {}
+
+        records = list(flushing_users.values())
+        try:
+            conn = get_connection()
+            with conn:
+                conn.executemany(SQL_UPSERT_USER, [(user_id, telegram_login) for user_id, telegram_login, _ in records])
+                conn.executemany(SQL_DELETE_USER_GROUPS, [(user_id,) for user_id, _, _ in records])
+                conn.executemany(SQL_INSERT_USER_GROUP, [
+                    (user_id, group_name, last_used_at)
+                    for user_id, _, recent in records
+                    for group_name, last_used_at in recent
+                ])
+        except Exception:
+            # Возвращаем пачку в буфер, не затирая более свежие изменения
+            with pending_lock:
+                for user_id, record in flushing_users.items():
+                    pending_users.setdefault(user_id, record)
+            raise
+        finally:
+            with pending_lock:
+                # Записанные данные сразу кладём в кеш, если их не успели изменить заново
+                for record in records:
+                    if record[0] not in pending_users:
+                        cache_user(record[0], record)
+                flushing_users = {}
+    return len(records)
+
+def flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush_pending_users()
+        except Exception as e:
+            print(f"Ошибка при записи пользователей в базу: {e}")
+
+def start_write_behind():
+    """Запустить фоновый сброс буфера пользователей (один раз на процесс)."""
+    global flush_thread
+    if flush_thread is None:
+        flush_thread = threading.Thread(target=flush_loop, name='db-write-behind', daemon=True)
+        flush_thread.start()
+
+# При штатном завершении процесса буфер сбрасывается в базу
+atexit.register(flush_pending_users)
+
+@timed_db
 def get_user(user_id):
-    """Получение информации о пользователе по ID."""
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    return cursor.fetchone()
+    """Получение информации о пользователе по ID: (id, telegram_login) или None."""
+    record = get_user_record(user_id)
+    return record[:2] if record else None
+
+@timed_db
+def get_recent_groups(user_id):
+    """Последние группы пользователя, от старых к новым."""
+    record = get_user_record(user_id)
+    return [group_name for group_name, _ in record[2]] if record else []
 
+@timed_db
+def get_group_audience(group_name):
+    """ID пользователей, у которых группа среди последних (по индексу group_name), без заблокировавших бота."""
+    flush_pending_users()
+    return [row[0] for row in get_connection().execute(SQL_GROUP_AUDIENCE, (group_name,)).fetchall()]
+
+@timed_db
 def get_all_users():
     """Получить всех пользователей и их группы из базы данных."""
-    cursor.execute('SELECT telegram_login, recent_groups FROM users')
-    return cursor.fetchall()
+    flush_pending_users()
+    return get_connection().execute(SQL_ALL_USERS).fetchall()
 
+@timed_db
 def get_all_user_ids():
     """Получить все Telegram ID пользователей из базы данных."""
-    cursor.execute('SELECT id FROM users')
-    return [row[0] for row in cursor.fetchall()]
\ No newline at end of file
+    flush_pending_users()
+    return [row[0] for row in get_connection().execute(SQL_ALL_USER_IDS).fetchall()]
+
+@timed_db
+def get_popular_groups(limit):
+    """Группы, чаще всего встречающиеся среди последних групп пользователей."""
+    flush_pending_users()
+    return [row[0] for row in get_connection().execute(SQL_POPULAR_GROUPS, (limit,)).fetchall()]
+
+@timed_db
+def get_broadcast_user_ids():
+    """ID пользователей для рассылки, без заблокировавших бота."""
+    flush_pending_users()
+    return [row[0] for row in get_connection().execute(SQL_BROADCAST_USER_IDS).fetchall()]
+
+@timed_db
+def mark_users_blocked(user_ids):
+    """Отметить пользователей, заблокировавших бота."""
+    def write():
+        conn = get_connection()
+        with conn:
+            conn.executemany(SQL_MARK_BLOCKED, [(user_id,) for user_id in user_ids])
+    run_db_write(write)
+
+@timed_db
+def get_users_page(after_id, limit):
+    """Страница пользователей с id больше after_id (keyset-пагинация по первичному ключу)."""
+    flush_pending_users()
+    return get_connection().execute(SQL_USERS_PAGE, (after_id, limit)).fetchall()
+
+@timed_db
+def get_user_count():
+    """Общее число пользователей без запроса к базе."""
+    return user_count
+
+@timed_db
+def subscribe_digest(user_id, group_name):
+    """Подписать пользователя на утреннее расписание группы (заменяет прежнюю подписку)."""
+    def write():
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_SUBSCRIBE_DIGEST, (user_id, group_name))
+    run_db_write(write)
+
+@timed_db
+def unsubscribe_digest(user_id):
+    def write():
+        conn = get_connection()
+        with conn:
+            conn.execute(SQL_UNSUBSCRIBE_DIGEST, (user_id,))
+    run_db_write(write)
+
+@timed_db
+def get_digest_subscription(user_id):
+    """Группа, на которую подписан пользователь, или None."""
+    row = get_connection().execute(SQL_GET_DIGEST_SUBSCRIPTION, (user_id,)).fetchone()
+    return row[0] if row else None
+
+@timed_db
+def get_digest_subscribers():
+    """Подписчики утренней рассылки, сгруппированные по группам: {группа: [user_id, ...]}."""
+    flush_pending_users()
+    subscribers = {}
+    for group_name, user_id in get_connection().execute(SQL_DIGEST_SUBSCRIBERS):
+        subscribers.setdefault(group_name, []).append(user_id)
+    return subscribers
+
+@timed_db
+def save_schedule_weeks(weeks, sessions, teachers, rooms):
+    """Заменить недели истории расписания одной транзакцией.
+
+    weeks - [(понедельник, воскресенье)] в ISO, остальные - строки таблиц schedule_sessions/teachers/rooms.
+    """
+    def write():
+        conn = get_connection()
+        now = time.time()
+        with conn:
+            for week_start, week_end in weeks:
+                for sql in SQL_DELETE_SCHEDULE_DAYS:
+                    conn.execute(sql, (week_start, week_end))
+                conn.execute(SQL_UPSERT_SCHEDULE_WEEK, (week_start, now))
+            conn.executemany(SQL_INSERT_SCHEDULE_SESSION, sessions)
+            conn.executemany(SQL_INSERT_SCHEDULE_TEACHER, teachers)
+            conn.executemany(SQL_INSERT_SCHEDULE_ROOM, rooms)
+    run_db_write(write)
+
+@timed_db
+def get_schedule_weeks():
+    """Понедельники всех сохранённых недель (ISO), по возрастанию."""
+    return [row[0] for row in get_connection().execute(SQL_SCHEDULE_WEEKS).fetchall()]
+
+@timed_db
+def get_schedule_range(first_date, last_date):
+    """Занятия всех групп за диапазон дат, по группам, датам и парам."""
+    return get_connection().execute(SQL_SCHEDULE_RANGE, (first_date, last_date)).fetchall()
+
+@timed_db
+def get_group_day(group_name, day_date):
+    """Занятия группы за один день (по первичному ключу)."""
+    return get_connection().execute(SQL_GROUP_DAY, (group_name, day_date)).fetchall()
+
+@timed_db
+def get_teacher_range(teacher_key, first_date, last_date):
+    """Занятия преподавателя за диапазон дат (по индексу teacher_key, day_date)."""
+    return get_connection().execute(SQL_TEACHER_RANGE, (teacher_key, first_date, last_date)).fetchall()
+
+@timed_db
+def get_room_range(auditorium, first_date, last_date):
+    """Занятия в аудитории за диапазон дат (по индексу auditorium, day_date)."""
+    return get_connection().execute(SQL_ROOM_RANGE, (auditorium, first_date, last_date)).fetchall()
@@ -0,0 +1,61 @@
+# File path: diff.py
+from utils import format_class_session
+
+# Сколько изменённых пар перечислять в одном уведомлении, чтобы не упереться в лимит длины сообщения
+MAX_CHANGES_LISTED = 15
+
+class GroupChange:
+    """Changed slots of one group: (day name, time, old text, new text); None text means no class."""
+    __slots__ = ('group_name', 'slots')
+
+    def __init__(self, group_name, slots):
+        self.group_name = group_name
+        self.slots = slots
+
+def diff_group(group_name, old_schedule, new_schedule):
+    old_slots = {(day.name, session.time): format_class_session(session) for day in old_schedule.days for session in day}
+    slots = []
+    for day in new_schedule.days:
+        for session in day:
+            key = (day.name, session.time)
+            old_text = old_slots.pop(key, None)
+            new_text = format_class_session(session)
+            if old_text != new_text:
+                slots.append((day.name, session.time, old_text, new_text))
+    # Пары, которые исчезли из нового расписания
+    for (day_name, time), old_text in old_slots.items():
+        if old_text:
+            slots.append((day_name, time, old_text, None))
+    return GroupChange(group_name, slots) if slots else None
+
+def diff_schedules(old_state, new_state):
+    """Changes per group between two schedule versions of the same week.
+
+    Groups with equal content hashes are skipped without looking at their sessions.
+    A group whose dates changed got a new week rather than a fix, so it is not reported.
+    """
+    changes = []
+    for group_name, new_schedule in new_state.schedule_data.items():
+        old_schedule = old_state.schedule_data.get(group_name)
+        if old_schedule is None:
+            continue
+        if old_state.group_hashes.get(group_name) == new_state.group_hashes.get(group_name):
+            continue
+        if old_schedule.keys() != new_schedule.keys():
+            continue
+        change = diff_group(group_name, old_schedule, new_schedule)
+        if change:
+            changes.append(change)
+    return changes
+
+def format_group_change(change):
+    """Short HTML notification listing what changed for one group."""
+    lines = [f"Изменения в расписании группы {change.group_name.replace('Группа', '').strip()}:"]
+    for day_name, time, old_text, new_text in change.slots[:MAX_CHANGES_LISTED]:
+        if new_text is None:
+            lines.append(f"<b>{day_name}</b>, {time}: пара отменена")
+        else:
+            lines.append(f"<b>{day_name}</b>: {new_text}")
+    if len(change.slots) > MAX_CHANGES_LISTED:
+        lines.append(f"...и ещё изменений: {len(change.slots) - MAX_CHANGES_LISTED}")
+    return "\n".join(lines)
@@ -0,0 +1,54 @@
+# File path: digest.py
+import time
+from datetime import time as day_time
+from broadcast import Broadcast
+from history import week_start
+from utils import LOCAL_TIMEZONE, render_day
+
+# Утренняя рассылка по будням и субботам в 7:00 по времени колледжа
+DIGEST_TIMEZONE = LOCAL_TIMEZONE
+DIGEST_TIME = day_time(7, 0, tzinfo=DIGEST_TIMEZONE)
+DIGEST_DAYS = (0, 1, 2, 3, 4, 5)
+
+def day_text(schedule_state, history, group_name, today):
+    """Rendered schedule of a group for today, or None if the group has no classes stored for today.
+
+    Today's day of the loaded week comes from its render cache. If another week was uploaded since
+    (next week, early on a Thursday), today's day is read from the schedule history instead.
+    """
+    day_month = today.strftime("%d.%m")
+    if schedule_state.day_dates.get(day_month) == today:
+        return schedule_state.render_cache.day_by_date(group_name, day_month)
+    day_schedule = history.day(group_name, today)
+    return render_day(day_schedule) if day_schedule is not None else None
+
+def run_digest(bot, schedule_state, history, subscribers, today, mark_blocked=None):
+    """Send today's schedule to every subscriber.
+
+    The text of each group is rendered once per run (keyed by group and date) and then fanned out to all
+    its subscribers, so rendering cost depends on the number of groups, not users.
+    """
+    started = time.perf_counter()
+    date = today.strftime("%d.%m")
+    groups_sent = users_total = delivered = 0
+    if schedule_state.day_dates.get(date) != today:
+        # Сегодняшняя неделя уже не загруженная: читаем её из истории одним запросом, дни групп дальше из памяти
+        history.week(week_start(today))
+    rendered = {}  # (группа, дата) -> текст дня, только на время этой рассылки
+
+    for group_name, user_ids in subscribers.items():
+        key = (group_name, today)
+        if key not in rendered:
+            rendered[key] = day_text(schedule_state, history, group_name, today)
+        if rendered[key] is None:
+            continue
+        text = f"Расписание на сегодня для группы {group_name.replace('Группа', '').strip()}:\n\n" + rendered[key]
+        result = Broadcast(bot, user_ids, text, mark_blocked=mark_blocked, parse_mode='HTML').run()
+        groups_sent += 1
+        users_total += len(user_ids)
+        delivered += result.sent
+
+    elapsed = time.perf_counter() - started
+    print(f"Утренняя рассылка {date}: групп {groups_sent} из {len(subscribers)}, "
+          f"подписчиков {users_total}, доставлено {delivered}, за {elapsed:.1f} с")
+    return groups_sent, delivered
@@ -0,0 +1,256 @@
+# File path: fake_bot_api.py
+"""Local stand-in for the Telegram Bot API to run the bot offline.
+
+FakeBotApi answers the methods the bot uses, hands out queued updates through getUpdates and records
+every call. Running this file starts the bot against it in a temporary directory and simulates
+many students pressing buttons at once:
+
+    python fake_bot_api.py --users 200
+"""
+import argparse
+import email.parser
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeBotApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Бот открывает до workers + 4 соединений сразу
+    request_queue_size = 128
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Расписание', 'username': 'schedule_test_bot'}
+
+class FakeBotApi:
+    """Bot API server on localhost; updates are queued with push_* and calls are read from .calls."""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.lock = threading.Condition()
+        self.updates = []
+        self.calls = []  # (время, метод, параметры)
+        self.files = {}  # file_id -> (путь в URL, содержимое)
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.server = FakeBotApiServer((host, port), self.request_handler())
+        self.host, self.port = self.server.server_address
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self):
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-bot-api', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Соединения пула бота переиспользуются, как с настоящим api.telegram.org
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело уходят отдельными пакетами; без TCP_NODELAY каждый ответ ждёт отложенный ACK (~40 мс)
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if self.path.startswith('/file/'):
+                    file_path = self.path.split('/', 3)[-1]  # /file/bot<token>/<file_path>
+                    content = next((data for path, data in api.files.values() if path == file_path), None)
+                    if content is None:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Length', str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                    return
+                self.do_POST()
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type') or ''
+                if body and 'json' in content_type:
+                    params = json.loads(body)
+                elif body and content_type.startswith('multipart/form-data'):
+                    params = api.form_params(content_type, body)
+                else:
+                    params = {}
+                method = self.path.rsplit('/', 1)[-1].split('?')[0]
+                result = api.handle(method, params)
+                response = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def form_params(self, content_type, body):
+        """Fields of a multipart upload (sendDocument with a file); file fields stay bytes."""
+        form = email.parser.BytesParser().parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        params = {}
+        for part in form.get_payload():
+            content = part.get_payload(decode=True)
+            if part.get_filename():
+                params[part.get_param('name', header='content-disposition')] = content
+                params['filename'] = part.get_filename()
+            else:
+                params[part.get_param('name', header='content-disposition')] = content.decode()
+        return params
+
+    def message(self, chat_id, text, from_user=None):
+        with self.lock:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        return {'message_id': message_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'},
+                'from': from_user or BOT_USER, 'text': text}
+
+    def handle(self, method, params):
+        if method == 'getUpdates':
+            return self.get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0))
+        with self.lock:
+            self.calls.append((time.monotonic(), method, params))
+            self.lock.notify_all()
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('sendMessage', 'editMessageText'):
+            message = self.message(int(params.get('chat_id') or 0), params.get('text', ''))
+            if params.get('message_id'):
+                message['message_id'] = int(params['message_id'])
+            return message
+        if method == 'sendDocument':
+            message = self.message(int(params.get('chat_id') or 0), None)
+            del message['text']
+            document = params.get('document')
+            # Загруженный файл получает новый file_id, повторная отправка по file_id файл не передаёт
+            if isinstance(document, bytes):
+                with self.lock:
+                    file_id = f'file{len(self.files) + 1}'
+                    self.files[file_id] = (f"documents/{params.get('filename')}", document)
+            else:
+                file_id = document
+            message['document'] = {'file_id': file_id, 'file_unique_id': file_id,
+                                   'file_name': os.path.basename(self.files[file_id][0])}
+            return message
+        if method == 'getFile':
+            file_path, content = self.files[params['file_id']]
+            return {'file_id': params['file_id'], 'file_unique_id': params['file_id'], 'file_size': len(content),
+                    'file_path': file_path}
+        return True
+
+    def get_updates(self, offset, timeout):
+        deadline = time.monotonic() + min(timeout, 1.0)
+        with self.lock:
+            # offset подтверждает всё, что бот уже получил
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self.lock.wait(deadline - time.monotonic())
+            return list(self.updates[:100])
+
+    def push(self, update):
+        with self.lock:
+            update['update_id'] = self.next_update_id
+            self.next_update_id += 1
+            self.updates.append(update)
+            self.lock.notify_all()
+
+    def user(self, chat_id):
+        return {'id': chat_id, 'is_bot': False, 'first_name': f'Студент {chat_id}', 'username': f'student{chat_id}'}
+
+    def push_message(self, chat_id, text):
+        message = self.message(chat_id, text, self.user(chat_id))
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        self.push({'message': message})
+
+    def push_callback(self, chat_id, data):
+        self.push({'callback_query': {'id': f'{chat_id}-{self.next_update_id}', 'from': self.user(chat_id),
+                                      'chat_instance': str(chat_id), 'data': data,
+                                      'message': self.message(chat_id, '')}})
+
+    def push_document(self, chat_id, file_path):
+        file_id = f'file{len(self.files) + 1}'
+        with open(file_path, 'rb') as f:
+            self.files[file_id] = (f'documents/{os.path.basename(file_path)}', f.read())
+        message = self.message(chat_id, None, self.user(chat_id))
+        del message['text']
+        message['document'] = {'file_id': file_id, 'file_unique_id': file_id, 'file_name': os.path.basename(file_path)}
+        self.push({'message': message})
+
+    def wait_for_calls(self, method, count, timeout=30.0):
+        """Wait until the bot made `count` calls of method; returns them."""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while True:
+                calls = [call for call in self.calls if call[1] == method]
+                if len(calls) >= count or time.monotonic() >= deadline:
+                    return calls
+                self.lock.wait(deadline - time.monotonic())
+
+def simulate(users, workers):
+    """Start the bot against FakeBotApi and press buttons for `users` students at once."""
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix='schedule-bot-')
+    shutil.copy(os.path.join(source_dir, 'schedule_file.xlsx'), workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)  # users.db и снимок расписания создаются во временном каталоге
+    sys.path.insert(0, source_dir)
+    import bot
+
+    bot.init_db()
+    api = FakeBotApi().start()
+    bot.current_schedule = bot.load_schedule(bot.SCHEDULE_FILE)
+    group_name = bot.current_schedule.keyboards.group_order[0]
+    updater = bot.build_updater(base_url=api.base_url, base_file_url=api.base_file_url, workers=workers)
+    updater.start_polling(poll_interval=0.0, timeout=1)
+    try:
+        started = time.monotonic()
+        for chat_id in range(1000, 1000 + users):
+            api.push_message(chat_id, '/start')
+        api.wait_for_calls('sendMessage', users)
+        for chat_id in range(1000, 1000 + users):
+            api.push_callback(chat_id, 'group_' + group_name)
+            api.push_callback(chat_id, 'week')
+        edits = api.wait_for_calls('editMessageText', 2 * users)
+        elapsed = time.monotonic() - started
+        print(f"Обработано {users} /start и {len(edits)} нажатий за {elapsed:.2f} с при {workers} потоках")
+
+        api.push_message(1000, '/search_teacher Лялина')
+        api.wait_for_calls('sendMessage', users + 1)
+        api.push_document(1000, bot.SCHEDULE_FILE)
+        reload_done = lambda: any('Расписание успешно обновлено' in call[2].get('text', '')
+                                  for call in api.calls if call[1] == 'editMessageText')
+        deadline = time.monotonic() + 60
+        while not reload_done() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        print("Загрузка файла через getFile:", "успешно" if reload_done() else "нет ответа")
+    finally:
+        updater.stop()
+        bot.flush_pending_users()
+        bot.shutdown_parse_executor()
+        api.stop()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Запуск бота против локального фейкового Bot API")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+    simulate(args.users, args.workers)
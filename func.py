@@ -1,36 +1,51 @@
 # File path: func.py
-import pandas as pd
-import json
-
-def replicate_discipline_info(schedule):
-    for day, sessions in schedule.items():
+from model import Session, Day, GroupSchedule, schedule_to_json
+
+# Движок разбора xlsx: 'openpyxl' (потоковое чтение за один проход) или 'pandas' (прежний путь)
+PARSER_ENGINE = 'openpyxl'
+
+SHEET_NAME = 'Колледж ВятГУ'
+
+# Define weekdays
+week_days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+
+class_times_first_five_days = [
+    "8.20-9.50", "10.00-11.30", "11.45-13.15", "14.00-15.30", "15.45-17.15", "17.20-18.50", "18.55 - 20.25"
+]
+class_times_sixth_day = [
+    "8.20-9.50", "10.00-11.30", "11.45-13.15", "13.20-14.50", "14.55-16.25", "16.30-18.00"
+]
+
+# Положение таблицы на листе (номера строк Excel, столбцы с нуля)
+HEADER_ROW = 24
+FIRST_DATE_ROW = 26
+LAST_ROW = 66
+DATE_COL = 6  # Столбец G
+LAST_COL = 221  # Столбец HN
+ROWS_PER_DAY = 7
+
+def replicate_discipline_info(days):
+    for day in days:
+        sessions = day.sessions
         # Loop through all sessions, including the last one
         for i in range(len(sessions)):
             current_session = sessions[i]
-            
+
             # For all but the last session
             if i < len(sessions) - 1:
                 next_session = sessions[i + 1]
                 # Check if the current session has a discipline and the next one lacks it but has a teacher and auditorium
-                if current_session['Discipline'] != 'nan' and next_session['Discipline'] == 'nan' and next_session['Teacher'] and next_session['Auditorium']:
+                if current_session.discipline != 'nan' and next_session.discipline == 'nan' and next_session.teacher and next_session.auditorium:
                     # Replicate discipline information to the next session
-                    next_session['Discipline'] = current_session['Discipline']
-                    sessions[i + 2]['Discipline'] = current_session['Discipline']
+                    next_session.discipline = current_session.discipline
+                    sessions[i + 2].discipline = current_session.discipline
 
-def extract_schedule_to_json(file_path):
-    # Define weekdays
-    week_days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+def extract_schedule_pandas(file_path):
+    import pandas as pd
 
-    df = pd.read_excel(file_path, sheet_name='Колледж ВятГУ', header=None, skiprows=23, nrows=44, usecols='A:HN')
+    df = pd.read_excel(file_path, sheet_name=SHEET_NAME, header=None, skiprows=23, nrows=44, usecols='A:HN')
     groups = {}
 
-    class_times_first_five_days = [
-        "8.20-9.50", "10.00-11.30", "11.45-13.15", "14.00-15.30", "15.45-17.15", "17.20-18.50", "18.55 - 20.25"
-    ]
-    class_times_sixth_day = [
-        "8.20-9.50", "10.00-11.30", "11.45-13.15", "13.20-14.50", "14.55-16.25", "16.30-18.00"
-    ]
-
     # Extract group names and data
     for col in range(df.shape[1]):
         cell_value = df.iloc[0, col]
@@ -50,12 +65,12 @@ def extract_schedule_to_json(file_path):
     structured_data = {}
 
     # Read dates from Excel
-    dates_df = pd.read_excel(file_path, sheet_name='Колледж ВятГУ', header=None, usecols="G:H", nrows=41, skiprows=25)
+    dates_df = pd.read_excel(file_path, sheet_name=SHEET_NAME, header=None, usecols="G:H", nrows=41, skiprows=25)
     dates = dates_df.iloc[::7, 0].dropna().tolist()
     dates = [date.split()[1] for date in dates]  # Extracting dates
 
     for group_name, schedule in groups.items():
-        structured_group_data = {}
+        structured_group_data = []
         day_counter = 0  # Reset day counter for each group
         time_index = 0
 
@@ -68,29 +83,133 @@ def extract_schedule_to_json(file_path):
             class_times = class_times_first_five_days if day_counter < 5 else class_times_sixth_day
             time = class_times[time_index] if time_index < len(class_times) else ""
 
-            class_session = {
-                "Time": time,
-                "Discipline": str(row.iloc[0]).strip(),
-                "Type of Class": str(row.iloc[1]).strip() if pd.notnull(row.iloc[1]) else "",
-                "Teacher": str(row.iloc[2]).strip() if pd.notnull(row.iloc[2]) else "",
-                "Auditorium": str(row.iloc[3]).strip() if pd.notnull(row.iloc[3]) else ""
-            }
+            class_session = Session(
+                time,
+                str(row.iloc[0]).strip(),
+                str(row.iloc[1]).strip() if pd.notnull(row.iloc[1]) else "",
+                str(row.iloc[2]).strip() if pd.notnull(row.iloc[2]) else "",
+                str(row.iloc[3]).strip() if pd.notnull(row.iloc[3]) else ""
+            )
             day_schedule.append(class_session)
             time_index += 1
 
             # Check if we need to move to the next day
             if (time_index == len(class_times) and day_counter < 5) or (time_index == len(class_times_sixth_day) and day_counter == 5) or index == schedule.index[-1]:
                 # Use the day_counter to index into week_days
-                day_key = f"{week_days[day_counter % len(week_days)]}, {dates[day_counter]}"  # Combine day and date
-                structured_group_data[day_key] = day_schedule
+                structured_group_data.append(Day(week_days[day_counter % len(week_days)], dates[day_counter], day_schedule))
                 day_schedule = []  # Reset day schedule for the next day
                 day_counter += 1  # Move to the next day
                 time_index = 0  # Reset time index for the new day
 
-        structured_data[group_name] = structured_group_data
-
-    for group_name, structured_group_data in structured_data.items():
-        replicate_discipline_info(structured_group_data)
-
-    json_data = json.dumps(structured_data, ensure_ascii=False, indent=4)
-    return json_data
\ No newline at end of file
+        structured_data[group_name] = GroupSchedule(group_name, structured_group_data)
+
+    for group_name, group_schedule in structured_data.items():
+        replicate_discipline_info(group_schedule.days)
+
+    return structured_data
+
+def cell_text(value):
+    """Convert a raw openpyxl cell value the same way pandas does; empty cells become None."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+class GroupBlockParser:
+    """Day/time state machine for one 4-column group block, fed row by row."""
+
+    def __init__(self, start_col):
+        self.start_col = start_col
+        self.structured_group_data = []
+        self.day_schedule = []
+        self.day_counter = 0
+        self.time_index = 0
+
+    def feed(self, row, dates):
+        discipline, type_of_class, teacher, auditorium = (cell_text(value) for value in row[self.start_col:self.start_col + 4])
+        if discipline is not None and discipline.strip() == "Дисциплина,модуль":
+            self.time_index = 0  # Reset time index at the start of each day
+            self.day_schedule = []
+            return
+
+        class_times = class_times_first_five_days if self.day_counter < 5 else class_times_sixth_day
+        time = class_times[self.time_index] if self.time_index < len(class_times) else ""
+
+        self.day_schedule.append(Session(
+            time,
+            discipline.strip() if discipline is not None else "nan",
+            type_of_class.strip() if type_of_class is not None else "",
+            teacher.strip() if teacher is not None else "",
+            auditorium.strip() if auditorium is not None else ""
+        ))
+        self.time_index += 1
+
+        if self.time_index == len(class_times) and self.day_counter <= 5:
+            self.close_day(dates)
+
+    def close_day(self, dates):
+        self.structured_group_data.append(Day(week_days[self.day_counter % len(week_days)], dates[self.day_counter], self.day_schedule))
+        self.day_schedule = []
+        self.day_counter += 1
+        self.time_index = 0
+
+    def finish(self, dates):
+        # Последняя строка таблицы закрывает незавершённый день, как и в pandas-версии
+        if self.day_schedule:
+            self.close_day(dates)
+        replicate_discipline_info(self.structured_group_data)
+        return self.structured_group_data
+
+def extract_schedule_openpyxl(file_path):
+    """Single pass over the sheet: group headers, dates and group blocks are read together."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook[SHEET_NAME]
+        rows = sheet.iter_rows(min_row=HEADER_ROW, max_row=LAST_ROW, max_col=LAST_COL + 1, values_only=True)
+
+        header = next(rows, ())
+        group_blocks = {}  # group name -> start column
+        for col, cell_value in enumerate(header):
+            text = cell_text(cell_value)
+            if text is None:
+                continue
+            for group_name in text.split("\n"):
+                group_name = group_name.strip()
+                if "Группа" in group_name:
+                    group_blocks[group_name] = col
+
+        # Несколько групп с общим заголовком делят один блок столбцов, разбираем его один раз
+        parsers = {col: GroupBlockParser(col) for col in set(group_blocks.values())}
+        dates = []
+        padding = (None,) * 4
+
+        for row_number, row in enumerate(rows, start=HEADER_ROW + 1):
+            row = tuple(row) + padding
+            if row_number >= FIRST_DATE_ROW and (row_number - FIRST_DATE_ROW) % ROWS_PER_DAY == 0:
+                date = cell_text(row[DATE_COL])
+                if date is not None:
+                    dates.append(date.split()[1])
+            for parser in parsers.values():
+                parser.feed(row, dates)
+    finally:
+        workbook.close()
+
+    # Группы одного блока получают собственный GroupSchedule с общим списком дней
+    blocks = {col: parser.finish(dates) for col, parser in parsers.items()}
+    return {group_name: GroupSchedule(group_name, blocks[col]) for group_name, col in group_blocks.items()}
+
+def extract_schedule(file_path, engine=None):
+    """Parse the workbook into {group name: GroupSchedule}."""
+    engine = engine or PARSER_ENGINE
+    if engine == 'pandas':
+        return extract_schedule_pandas(file_path)
+    if engine == 'openpyxl':
+        return extract_schedule_openpyxl(file_path)
+    raise ValueError(f"Неизвестный движок разбора расписания: {engine}")
+
+def extract_schedule_to_json(file_path, engine=None):
+    """Optional JSON export of the parsed schedule, kept for comparing engines and debugging."""
+    return schedule_to_json(extract_schedule(file_path, engine))
@@ -0,0 +1,154 @@
+# File path: history.py
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from db import get_group_day, get_room_range, get_schedule_range, get_schedule_weeks, get_teacher_range, save_schedule_weeks
+from model import Day, GroupSchedule, Session
+from utils import format_class_session, session_teacher_keys
+
+# Сколько недель держим в памяти: текущую и соседние
+HOT_WEEKS = 3
+
+def week_start(day_date):
+    return day_date - timedelta(days=day_date.weekday())
+
+def week_bounds(monday):
+    """(first, last) ISO dates of the week for range queries."""
+    return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+
+def schedule_rows(schedule_data, day_dates):
+    """Weeks covered by a parsed schedule and the rows of schedule_sessions, schedule_teachers and schedule_rooms.
+
+    day_dates is the sheet's 'дд.мм' -> date mapping from sheet_dates, the same one /now and the .ics export use.
+    """
+    weeks, sessions, teachers, rooms = set(), [], [], set()
+    for group_name, group_schedule in schedule_data.items():
+        for day_schedule in group_schedule.days:
+            day_date = day_dates.get(day_schedule.date)
+            if day_date is None:
+                continue
+            weeks.add(week_start(day_date))
+            iso_date = day_date.isoformat()
+            for position, class_session in enumerate(day_schedule):
+                sessions.append((group_name, iso_date, position, day_schedule.weekday, class_session.time,
+                                 class_session.discipline, class_session.type_of_class, class_session.teacher,
+                                 class_session.auditorium))
+                formatted_session = format_class_session(class_session)
+                if not formatted_session:
+                    continue
+                # Преподаватели и аудитории индексируются так же, как для поиска по текущему расписанию
+                for key in session_teacher_keys(class_session, formatted_session):
+                    teachers.append((key, iso_date, group_name, position))
+                for room in class_session.auditorium.split('\n'):
+                    if room.strip():
+                        rooms.add((room.strip(), iso_date, group_name, position))
+    return sorted(weeks), sessions, teachers, sorted(rooms)
+
+def session_from_row(row):
+    return Session(*row[3:8])
+
+def day_from_rows(day_date, weekday, rows):
+    return Day(weekday, date.fromisoformat(day_date).strftime('%d.%m'), [session_from_row(row) for row in rows])
+
+def schedule_from_rows(rows):
+    """{group name: GroupSchedule} from rows ordered by group, date and position."""
+    schedule_data = {}
+    for group_name, group_rows in groupby(rows, key=itemgetter(0)):
+        days = [day_from_rows(day_date, weekday, day_rows)
+                for (day_date, weekday), day_rows in groupby(group_rows, key=itemgetter(1, 2))]
+        schedule_data[group_name] = GroupSchedule(group_name, days)
+    return schedule_data
+
+class ScheduleHistory:
+    """Every imported week in SQLite, loaded lazily.
+
+    Whole weeks are read with one range query over day_date and kept in a small LRU, so the current week and
+    its neighbours are served from memory; a day of any other week is a point query on (group, date).
+    """
+
+    def __init__(self, maxsize=HOT_WEEKS):
+        self.maxsize = maxsize
+        self.weeks = OrderedDict()  # понедельник -> {группа: GroupSchedule}
+        self.week_starts = None  # понедельники сохранённых недель, читаются из базы при первом обращении
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def import_schedule(self, schedule_data, day_dates):
+        """Store a parsed schedule, replacing the weeks it covers; returns their Mondays."""
+        weeks, sessions, teachers, rooms = schedule_rows(schedule_data, day_dates)
+        if not weeks:
+            return []
+        save_schedule_weeks([week_bounds(monday) for monday in weeks], sessions, teachers, rooms)
+        with self.lock:
+            for monday in weeks:
+                self.weeks.pop(monday, None)
+            self.week_starts = None
+        # Только что загруженные недели спрашивают первыми, читаем их в память сразу
+        for monday in weeks:
+            self.week(monday)
+        return weeks
+
+    def stored_weeks(self):
+        with self.lock:
+            if self.week_starts is not None:
+                return self.week_starts
+        week_starts = [date.fromisoformat(monday) for monday in get_schedule_weeks()]
+        with self.lock:
+            self.week_starts = week_starts
+        return week_starts
+
+    def adjacent_weeks(self, monday):
+        """(previous stored Monday or None, next stored Monday or None)."""
+        week_starts = self.stored_weeks()
+        earlier = [week for week in week_starts if week < monday]
+        later = [week for week in week_starts if week > monday]
+        return (earlier[-1] if earlier else None), (later[0] if later else None)
+
+    def cached_week(self, monday):
+        with self.lock:
+            schedule_data = self.weeks.get(monday)
+            if schedule_data is not None:
+                self.weeks.move_to_end(monday)
+                self.hits += 1
+            return schedule_data
+
+    def week(self, monday):
+        """{group name: GroupSchedule} of the week starting on monday; empty if it was never imported."""
+        schedule_data = self.cached_week(monday)
+        if schedule_data is not None:
+            return schedule_data
+        schedule_data = schedule_from_rows(get_schedule_range(*week_bounds(monday)))
+        with self.lock:
+            self.misses += 1
+            self.weeks[monday] = schedule_data
+            self.weeks.move_to_end(monday)
+            if len(self.weeks) > self.maxsize:
+                self.weeks.popitem(last=False)
+        return schedule_data
+
+    def day(self, group_name, day_date):
+        """Day of a group on a date or None; a week that is not in memory is not loaded for one day."""
+        schedule_data = self.cached_week(week_start(day_date))
+        if schedule_data is not None:
+            group_schedule = schedule_data.get(group_name)
+            day_name = day_date.strftime('%d.%m')
+            return next((day for day in group_schedule.days if day.date == day_name), None) if group_schedule else None
+        rows = get_group_day(group_name, day_date.isoformat())
+        return day_from_rows(rows[0][1], rows[0][2], rows) if rows else None
+
+    def teacher_sessions(self, key, first_date, last_date):
+        """[(date, group name, Session)] of a teacher in the date range, by date and slot."""
+        return [(date.fromisoformat(row[1]), row[0], session_from_row(row))
+                for row in get_teacher_range(key, first_date.isoformat(), last_date.isoformat())]
+
+    def room_sessions(self, auditorium, first_date, last_date):
+        """[(date, group name, Session)] held in an auditorium in the date range, by date and slot."""
+        return [(date.fromisoformat(row[1]), row[0], session_from_row(row))
+                for row in get_room_range(auditorium, first_date.isoformat(), last_date.isoformat())]
+
+    def stats(self):
+        return {'entries': len(self.weeks), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,125 @@
+# File path: ical.py
+import hashlib
+from datetime import datetime
+
+import pytz
+
+from utils import LOCAL_TIMEZONE, parse_time_range, teacher_key
+
+PRODID = '-//Расписание ВятГУ//schedule-bot//RU'
+# RFC 5545: строки длиннее 75 октетов переносятся, продолжение начинается с пробела
+LINE_LIMIT = 75
+
+def escape_text(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def fold_line(line):
+    """Content line split into CRLF-terminated pieces of at most 75 octets, never inside a UTF-8 character."""
+    encoded = line.encode()
+    if len(encoded) <= LINE_LIMIT:
+        return encoded + b'\r\n'
+    pieces = []
+    piece, size, limit = [], 0, LINE_LIMIT
+    for char in line:
+        char_size = len(char.encode())
+        if size + char_size > limit:
+            pieces.append(''.join(piece))
+            piece, size, limit = [], 0, LINE_LIMIT - 1
+        piece.append(char)
+        size += char_size
+    pieces.append(''.join(piece))
+    return '\r\n '.join(pieces).encode() + b'\r\n'
+
+def format_utc(moment):
+    return moment.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def session_parts(class_session):
+    """(index, discipline, teacher, auditorium) of every subgroup, skipping 'nan' like format_class_session."""
+    disciplines = class_session.discipline.split('\n')
+    teachers = class_session.teacher.split('\n')
+    auditoriums = class_session.auditorium.split('\n')
+    for idx, discipline in enumerate(disciplines):
+        if discipline.strip().lower() == 'nan' or not discipline.strip():
+            continue
+        teacher = teachers[idx].strip() if idx < len(teachers) else ""
+        auditorium = auditoriums[idx].strip() if idx < len(auditoriums) else ""
+        yield idx, discipline.strip(), teacher, auditorium
+
+def group_title(group_name):
+    return group_name.replace('Группа', '').strip()
+
+def schedule_events(schedule_data, day_dates, group_names, teacher=None):
+    """(uid, start, end, summary, location, description) of the groups' sessions, optionally of one teacher only."""
+    for group_name in group_names:
+        group_schedule = schedule_data.get(group_name)
+        if group_schedule is None:
+            continue
+        for day_schedule in group_schedule.days:
+            # Даты дней определены один раз для всего листа при его загрузке, как и для /now
+            day_date = day_dates.get(day_schedule.date)
+            if day_date is None:
+                continue
+            for class_session in day_schedule:
+                try:
+                    start_time, end_time = parse_time_range(class_session.time)
+                except ValueError:
+                    continue
+                start = LOCAL_TIMEZONE.localize(datetime.combine(day_date, start_time))
+                end = LOCAL_TIMEZONE.localize(datetime.combine(day_date, end_time))
+                for idx, discipline, session_teacher, auditorium in session_parts(class_session):
+                    if teacher is not None and teacher_key(session_teacher) != teacher:
+                        continue
+                    # UID постоянен для занятия, поэтому повторный импорт обновляет события, а не дублирует их
+                    uid = hashlib.blake2b(f"{group_name}|{day_date}|{class_session.time}|{idx}".encode(),
+                                          digest_size=12).hexdigest()
+                    details = [class_session.type_of_class]
+                    if teacher is None:
+                        summary = discipline
+                        details.append(f"Преп: {session_teacher}" if session_teacher else "")
+                    else:
+                        summary = f"{discipline} ({group_title(group_name)})"
+                        details.append(group_name)
+                    description = "\n".join(detail for detail in details if detail)
+                    yield uid, start, end, summary, auditorium, description
+
+def calendar_lines(name, events):
+    """Folded content lines of a VCALENDAR, produced one event at a time."""
+    stamp = format_utc(datetime.now(pytz.utc))
+    yield fold_line('BEGIN:VCALENDAR')
+    yield fold_line('VERSION:2.0')
+    yield fold_line(f'PRODID:{PRODID}')
+    yield fold_line('CALSCALE:GREGORIAN')
+    yield fold_line('METHOD:PUBLISH')
+    yield fold_line(f'X-WR-CALNAME:{escape_text(name)}')
+    yield fold_line(f'X-WR-TIMEZONE:{LOCAL_TIMEZONE.zone}')
+    for uid, start, end, summary, location, description in events:
+        yield fold_line('BEGIN:VEVENT')
+        yield fold_line(f'UID:{uid}@schedule-bot')
+        yield fold_line(f'DTSTAMP:{stamp}')
+        yield fold_line(f'DTSTART:{format_utc(start)}')
+        yield fold_line(f'DTEND:{format_utc(end)}')
+        yield fold_line(f'SUMMARY:{escape_text(summary)}')
+        if location:
+            yield fold_line(f'LOCATION:{escape_text(location)}')
+        if description:
+            yield fold_line(f'DESCRIPTION:{escape_text(description)}')
+        yield fold_line('END:VEVENT')
+    yield fold_line('END:VCALENDAR')
+
+def group_calendar(schedule_state, group_name):
+    return calendar_lines(f"Расписание {group_title(group_name)}",
+                          schedule_events(schedule_state.schedule_data, schedule_state.day_dates, [group_name]))
+
+def teacher_calendar(schedule_state, key):
+    """Calendar of one teacher; only the groups the teacher index lists for the surname are scanned."""
+    group_names = sorted({entry[2] for entry in schedule_state.teacher_index.get(key, [])})
+    return calendar_lines(f"Расписание {key.capitalize()}",
+                          schedule_events(schedule_state.schedule_data, schedule_state.day_dates, group_names, teacher=key))
+
+def write_calendar(lines, f):
+    """Write the lines as they are generated; the whole .ics is never built as one string."""
+    size = 0
+    for line in lines:
+        f.write(line)
+        size += len(line)
+    return size
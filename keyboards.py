@@ -0,0 +1,87 @@
+# File path: keyboards.py
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+SEARCH_BUTTONS = [
+    [InlineKeyboardButton("Поиск 🔍", callback_data='start_search')],
+    [InlineKeyboardButton("Поиск преподавателя 🔍", callback_data='search_teacher_prompt')],
+]
+PREV_PAGE_BUTTON = InlineKeyboardButton("⬅️ Назад", callback_data='prev_page')
+NEXT_PAGE_BUTTON = InlineKeyboardButton("Вперед ➡️", callback_data='next_page')
+DAY_BACK_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Назад 🔙", callback_data='back_to_day_selection')]])
+OPTIONS_BACK_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("Назад 🔙", callback_data='back_to_schedule_options')]])
+
+def options_markup(dates):
+    start_date = dates[0].split(', ')[1] if dates else "Н/Д"
+    end_date = dates[-1].split(', ')[1] if dates else "Н/Д"
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"На неделю ({start_date} - {end_date})", callback_data='week')],
+        [InlineKeyboardButton("Выбрать день", callback_data='select_day')],
+        [InlineKeyboardButton("Назад 🔙", callback_data='back_to_group_selection')]
+    ])
+
+def days_markup(dates):
+    # Кнопка несёт дату дня (date_<дд.мм>), а не его номер в неделе: после загрузки другой недели
+    # старая кнопка показывает свой день из истории расписаний, а не день с тем же номером
+    keyboard = [[InlineKeyboardButton(date, callback_data=f"date_{date.rsplit(', ', 1)[-1]}")] for date in dates]
+    keyboard.append([InlineKeyboardButton("Назад 🔙", callback_data='back_to_schedule_options')])
+    return InlineKeyboardMarkup(keyboard)
+
+class GroupKeyboards:
+    """Keyboards of one schedule version, built once when the schedule is loaded.
+
+    Group buttons are kept in sorted order; a user's starred groups are put in front at render time,
+    so a page costs a slice of the base order instead of re-sorting every group.
+    """
+
+    def __init__(self, schedule_data, groups_per_page):
+        self.groups_per_page = groups_per_page
+        self.group_order = sorted(schedule_data.keys())
+        self.positions = {group: i for i, group in enumerate(self.group_order)}
+        self.group_buttons = [InlineKeyboardButton(group, callback_data='group_' + group) for group in self.group_order]
+        self.options = {group: options_markup(group_schedule.keys()) for group, group_schedule in schedule_data.items()}
+        self.days = {group: days_markup(group_schedule.keys()) for group, group_schedule in schedule_data.items()}
+
+    def options_markup(self, group_name):
+        return self.options.get(group_name) or options_markup([])
+
+    def days_markup(self, group_name):
+        return self.days.get(group_name) or days_markup([])
+
+    def page_count(self):
+        return max((len(self.group_order) - 1) // self.groups_per_page + 1, 1)
+
+    def page_groups(self, page, starred_groups):
+        """(group, is starred) for one page: starred groups first, then the rest in base order."""
+        starred = sorted(group for group in set(starred_groups) if group in self.positions)
+        start = page * self.groups_per_page
+        end = min(start + self.groups_per_page, len(self.group_order))
+        groups = [(group, True) for group in starred[start:end]]
+
+        # Позиция в общем порядке, с которой начинаются незвёздные группы этой страницы
+        position = max(start - len(starred), 0)
+        for starred_position in sorted(self.positions[group] for group in starred):
+            if starred_position <= position:
+                position += 1
+        starred_positions = {self.positions[group] for group in starred}
+        while len(groups) < end - start and position < len(self.group_order):
+            if position not in starred_positions:
+                groups.append((self.group_order[position], False))
+            position += 1
+        return groups
+
+    def page_markup(self, page, starred_groups):
+        keyboard = [
+            [InlineKeyboardButton(f"★ {group}", callback_data='group_' + group) if is_starred
+             else self.group_buttons[self.positions[group]]]
+            for group, is_starred in self.page_groups(page, starred_groups)
+        ]
+        keyboard.extend(SEARCH_BUTTONS)
+
+        navigation_buttons = []
+        if page > 0:
+            navigation_buttons.append(PREV_PAGE_BUTTON)
+        if page < self.page_count() - 1:
+            navigation_buttons.append(NEXT_PAGE_BUTTON)
+        if navigation_buttons:
+            keyboard.append(navigation_buttons)
+        return InlineKeyboardMarkup(keyboard)
@@ -0,0 +1,168 @@
+# File path: metrics.py
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Метрики отдаются только локально, снаружи порт не открывается
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    'bot_handler_seconds': ('histogram', 'Latency of dispatcher handlers by handler and callback type.'),
+    'bot_handler_errors_total': ('counter', 'Exceptions raised by dispatcher handlers.'),
+    'bot_db_seconds': ('histogram', 'Latency of db.py calls by function.'),
+    'bot_db_errors_total': ('counter', 'Exceptions raised by db.py calls.'),
+    'bot_schedule_parse_seconds': ('gauge', 'Duration of the last full workbook parse.'),
+    'bot_schedule_index_seconds': ('gauge', 'Duration of building indexes for the last schedule version.'),
+    'bot_schedule_groups': ('gauge', 'Groups in the current schedule.'),
+    'bot_schedule_sessions': ('gauge', 'Class sessions in the current schedule.'),
+}
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+    __slots__ = ('bucket_counts', 'total', 'count')
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(LATENCY_BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile; rough, but enough for /stats."""
+        rank = q * self.count
+        for bound, bucket_count in zip(LATENCY_BUCKETS, self.bucket_counts):
+            if bucket_count >= rank:
+                return bound
+        return float('inf')
+
+# Ключ метрики: (имя, ((метка, значение), ...))
+lock = threading.Lock()
+histograms = {}
+counters = {}
+gauges = {}
+
+def observe(name, labels, seconds):
+    with lock:
+        histogram = histograms.get((name, labels))
+        if histogram is None:
+            histogram = histograms[(name, labels)] = Histogram()
+        histogram.observe(seconds)
+
+def inc(name, labels, amount=1):
+    with lock:
+        counters[(name, labels)] = counters.get((name, labels), 0) + amount
+
+def set_gauge(name, value, labels=()):
+    with lock:
+        gauges[(name, labels)] = value
+
+def timed_handler(name, handler, kind=None):
+    """Wrap a dispatcher callback; kind(update) gives the callback type label, e.g. 'group' for group_<name>."""
+    @functools.wraps(handler)
+    def wrapper(update, context):
+        labels = (('handler', name), ('type', kind(update) if kind else name))
+        started = time.perf_counter()
+        try:
+            return handler(update, context)
+        except Exception:
+            inc('bot_handler_errors_total', labels)
+            raise
+        finally:
+            observe('bot_handler_seconds', labels, time.perf_counter() - started)
+    return wrapper
+
+def timed_db(func):
+    """Decorator for db.py functions."""
+    labels = (('query', func.__name__),)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            inc('bot_db_errors_total', labels)
+            raise
+        finally:
+            observe('bot_db_seconds', labels, time.perf_counter() - started)
+    return wrapper
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels, extra=()):
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in pairs) + "}"
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with lock:
+        histogram_items = [(key, list(h.bucket_counts), h.total, h.count) for key, h in histograms.items()]
+        counter_items = list(counters.items())
+        gauge_items = list(gauges.items())
+
+    lines = []
+    for name, (metric_type, help_text) in METRIC_HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type == 'histogram':
+            for (metric, labels), bucket_counts, total, count in sorted(histogram_items):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(LATENCY_BUCKETS, bucket_counts):
+                    lines.append(f"{name}_bucket{format_labels(labels, (('le', bound),))} {bucket_count}")
+                lines.append(f"{name}_bucket{format_labels(labels, (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        else:
+            items = counter_items if metric_type == 'counter' else gauge_items
+            for (metric, labels), value in sorted(items):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def summary(name='bot_handler_seconds', errors_name='bot_handler_errors_total'):
+    """[(labels dict, count, errors, average seconds, p95 seconds)] sorted by total time, for /stats."""
+    with lock:
+        rows = [
+            (dict(labels), h.count, counters.get((errors_name, labels), 0), h.total / h.count, h.quantile(0.95), h.total)
+            for (metric, labels), h in histograms.items() if metric == name and h.count
+        ]
+    rows.sort(key=lambda row: row[5], reverse=True)
+    return [row[:5] for row in rows]
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics from a daemon thread; a busy port only disables the endpoint."""
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    except OSError as e:
+        print(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
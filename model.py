@@ -0,0 +1,101 @@
+# File path: model.py
+import hashlib
+import json
+import sys
+
+class Session:
+    """One class slot of a group; empty slots keep discipline 'nan' like the sheet parser does."""
+    __slots__ = ('time', 'discipline', 'type_of_class', 'teacher', 'auditorium')
+
+    def __init__(self, time, discipline, type_of_class="", teacher="", auditorium=""):
+        # Одни и те же строки повторяются в сотнях занятий, поэтому храним их в одном экземпляре
+        self.time = sys.intern(time)
+        self.discipline = sys.intern(discipline)
+        self.type_of_class = sys.intern(type_of_class)
+        self.teacher = sys.intern(teacher)
+        self.auditorium = sys.intern(auditorium)
+
+    def __eq__(self, other):
+        return isinstance(other, Session) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Session({self.time!r}, {self.discipline!r}, {self.type_of_class!r}, {self.teacher!r}, {self.auditorium!r})"
+
+    def to_dict(self):
+        return {
+            "Time": self.time,
+            "Discipline": self.discipline,
+            "Type of Class": self.type_of_class,
+            "Teacher": self.teacher,
+            "Auditorium": self.auditorium
+        }
+
+class Day:
+    """Sessions of one day; name is the display key, e.g. 'Понедельник, 15.04'."""
+    __slots__ = ('weekday', 'date', 'name', 'sessions')
+
+    def __init__(self, weekday, date, sessions):
+        self.weekday = sys.intern(weekday)
+        self.date = sys.intern(date)
+        self.name = f"{weekday}, {date}"
+        self.sessions = sessions
+
+    def __iter__(self):
+        return iter(self.sessions)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __repr__(self):
+        return f"Day({self.name!r}, {len(self.sessions)} sessions)"
+
+class GroupSchedule:
+    """Week schedule of one group. Supports keys()/items()/[] by day name like the old dict."""
+    __slots__ = ('name', 'days')
+
+    def __init__(self, name, days):
+        self.name = name
+        self.days = days
+
+    def keys(self):
+        return [day.name for day in self.days]
+
+    def items(self):
+        return [(day.name, day) for day in self.days]
+
+    def __getitem__(self, day_name):
+        for day in self.days:
+            if day.name == day_name:
+                return day
+        raise KeyError(day_name)
+
+    def __contains__(self, day_name):
+        return any(day.name == day_name for day in self.days)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.days)
+
+    def __repr__(self):
+        return f"GroupSchedule({self.name!r}, {len(self.days)} days)"
+
+    def to_dict(self):
+        return {day.name: [session.to_dict() for session in day.sessions] for day in self.days}
+
+    def content_hash(self):
+        """Digest of everything shown for the group; equal hashes mean the week did not change."""
+        digest = hashlib.blake2b(digest_size=16)
+        for day in self.days:
+            digest.update(day.name.encode())
+            for session in day.sessions:
+                digest.update("\x1f".join((session.time, session.discipline, session.type_of_class,
+                                           session.teacher, session.auditorium)).encode())
+                digest.update(b"\x1e")
+        return digest.hexdigest()
+
+def schedule_to_json(schedule_data, indent=4):
+    """Optional JSON export of {group name: GroupSchedule} in the historical format."""
+    return json.dumps({group_name: group_schedule.to_dict() for group_name, group_schedule in schedule_data.items()},
+                      ensure_ascii=False, indent=indent)
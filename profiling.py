@@ -0,0 +1,138 @@
+# File path: profiling.py
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Частота выборки стеков и ограничения для команды /profile
+SAMPLE_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 300
+TOP_N = 15
+TRACEMALLOC_FRAMES = 10
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Потоки, которые почти всё время спят внутри кода бота и только шумели бы в отчёте
+IDLE_THREADS = ('db-write-behind', 'profiler', 'metrics')
+
+def describe(code):
+    file_name = os.path.relpath(code.co_filename, SOURCE_DIR) if code.co_filename.startswith(SOURCE_DIR) else os.path.basename(code.co_filename)
+    return f"{code.co_name} ({file_name}:{code.co_firstlineno})"
+
+class Sampler:
+    """Statistical profiler: every interval it looks at the stacks of all threads.
+
+    Only stacks that pass through the bot's own modules are counted, so idle dispatcher workers are skipped.
+    Nothing is hooked into the interpreter, and when no sampler runs there is no cost at all.
+    """
+
+    def __init__(self, seconds, interval=SAMPLE_INTERVAL):
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = 0
+        self.self_counts = {}  # функция -> выборки, где она на вершине стека
+        self.total_counts = {}  # функция -> выборки, где она есть в стеке
+
+    def sample(self):
+        own_ident = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident or names.get(ident, '').startswith(IDLE_THREADS):
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if not any(code.co_filename.startswith(SOURCE_DIR) for code in codes):
+                continue
+            self.samples += 1
+            self.self_counts[codes[0]] = self.self_counts.get(codes[0], 0) + 1
+            for code in set(codes):
+                self.total_counts[code] = self.total_counts.get(code, 0) + 1
+
+    def run(self):
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            self.sample()
+            time.sleep(self.interval)
+        return self
+
+    def report(self, top=TOP_N):
+        if not self.samples:
+            return f"За {self.seconds} с бот не выполнял своего кода: выборок нет."
+        lines = [f"Профиль за {self.seconds} с, выборок в коде бота: {self.samples}", "", "Собственное время:"]
+        for code, count in sorted(self.self_counts.items(), key=lambda item: item[1], reverse=True)[:top]:
+            lines.append(f"{count * 100 / self.samples:5.1f}% {describe(code)}")
+        lines.extend(["", "С учётом вызовов (только код бота):"])
+        own_code = [(code, count) for code, count in self.total_counts.items() if code.co_filename.startswith(SOURCE_DIR)]
+        for code, count in sorted(own_code, key=lambda item: item[1], reverse=True)[:top]:
+            lines.append(f"{count * 100 / self.samples:5.1f}% {describe(code)}")
+        return "\n".join(lines)
+
+profile_lock = threading.Lock()
+profile_running = False
+
+def start_profile(seconds, on_done):
+    """Sample for `seconds` in a background thread and pass the report to on_done; False if one already runs."""
+    global profile_running
+    with profile_lock:
+        if profile_running:
+            return False
+        profile_running = True
+
+    def run():
+        global profile_running
+        try:
+            report = Sampler(seconds).run().report()
+        finally:
+            with profile_lock:
+                profile_running = False
+        on_done(report)
+
+    threading.Thread(target=run, name='profiler', daemon=True).start()
+    return True
+
+# /memtrace: кому отправить отчёт о следующей загрузке и снимок памяти, снятый в её начале.
+# Пока загрузка не началась, tracemalloc выключен и обработчики работают без накладных расходов
+memtrace_lock = threading.Lock()
+memtrace_chat_id = None
+memtrace_before = None
+
+def arm_memtrace(chat_id):
+    """Ask for a memory report of the next reload; tracing itself starts only when that reload does."""
+    global memtrace_chat_id
+    with memtrace_lock:
+        memtrace_chat_id = chat_id
+
+def start_memtrace():
+    """At the start of a reload: if /memtrace is armed, start tracemalloc and take the 'before' snapshot."""
+    global memtrace_before
+    with memtrace_lock:
+        if memtrace_chat_id is None or memtrace_before is not None:
+            return
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        memtrace_before = tracemalloc.take_snapshot()
+
+def finish_memtrace():
+    """After the swap: (chat id, report) and tracemalloc is stopped again; None when this reload was not traced."""
+    global memtrace_before, memtrace_chat_id
+    with memtrace_lock:
+        if memtrace_before is None:
+            return None
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        before, chat_id = memtrace_before, memtrace_chat_id
+        memtrace_before = memtrace_chat_id = None
+        tracemalloc.stop()
+    return chat_id, format_memory_diff(before, after, peak)
+
+def format_memory_diff(before, after, peak, top=TOP_N):
+    stats = after.compare_to(before, 'lineno')
+    growth = sum(stat.size_diff for stat in stats)
+    lines = [f"Память после загрузки расписания: {growth / 1024 / 1024:+.1f} МиБ, пик трассировки {peak / 1024 / 1024:.1f} МиБ",
+             "", "Места выделения памяти:"]
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        file_name = os.path.relpath(frame.filename, SOURCE_DIR) if frame.filename.startswith(SOURCE_DIR) else os.path.basename(frame.filename)
+        lines.append(f"{stat.size_diff / 1024:+9.0f} КиБ ({stat.count_diff:+d} блоков) {file_name}:{frame.lineno}")
+    return "\n".join(lines)
@@ -0,0 +1,49 @@
+# File path: snapshot.py
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Меняется при любом изменении классов model.py, чтобы старые снимки не подхватывались
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snapshot'
+
+def file_digest(file_path):
+    """SHA-256 of the workbook content; the snapshot is valid only for this exact file."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def snapshot_path(file_path):
+    return file_path + SNAPSHOT_SUFFIX
+
+def load_snapshot(file_path, digest):
+    """Return the parsed schedule stored for this workbook, or None if the snapshot is missing, stale or corrupt."""
+    path = snapshot_path(file_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot['version'] != SNAPSHOT_VERSION or snapshot['digest'] != digest:
+            return None
+        return snapshot['schedule']
+    except Exception as e:
+        print(f"Снимок расписания повреждён, выполняется полный разбор: {e}")
+        return None
+
+def save_snapshot(file_path, digest, schedule_data):
+    """Atomically replace the snapshot: write to a temp file in the same directory, then rename."""
+    path = snapshot_path(file_path)
+    snapshot = {'version': SNAPSHOT_VERSION, 'digest': digest, 'schedule': schedule_data}
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        print(f"Не удалось сохранить снимок расписания: {e}")
@@ -1,6 +1,8 @@
 # File path: test.py
 # Импортируем модуль работы с базой данных
-from db import add_or_update_user
+from db import add_or_update_user, init_db
+
+init_db()
 
 # Добавляем 20 пользователей
 users = [
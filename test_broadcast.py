@@ -0,0 +1,95 @@
+# File path: test_broadcast.py
+# Проверка рассылки без Telegram: фейковый бот записывает отправки. Запуск: python -m unittest test_broadcast
+import threading
+import time
+import unittest
+
+from telegram.error import BadRequest, RetryAfter, Unauthorized
+
+from broadcast import Broadcast, ChatLimiter, TokenBucket
+
+class FakeBot:
+    """Records every send_message; errors[chat_id] is a list of exceptions raised on consecutive attempts."""
+
+    def __init__(self, errors=None):
+        self.errors = {chat_id: list(chat_errors) for chat_id, chat_errors in (errors or {}).items()}
+        self.sends = []  # (время, chat_id, текст)
+        self.attempts = {}
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, parse_mode=None):
+        with self.lock:
+            self.attempts[chat_id] = self.attempts.get(chat_id, 0) + 1
+            chat_errors = self.errors.get(chat_id)
+            if chat_errors:
+                raise chat_errors.pop(0)
+            self.sends.append((time.monotonic(), chat_id, text))
+
+class FakeStatusMessage:
+    def __init__(self):
+        self.edits = []
+
+    def edit_text(self, text):
+        self.edits.append(text)
+
+def run_broadcast(user_ids, bot, rate=1000, capacity=1000, status_message=None, mark_blocked=None):
+    # Свои ограничители на каждый тест: общие для процесса лимиты не должны влиять на результат
+    return Broadcast(bot, user_ids, "Текст", status_message, mark_blocked,
+                     bucket=TokenBucket(rate, capacity), chat_limiter=ChatLimiter(0.0), workers=8).run()
+
+class BroadcastTest(unittest.TestCase):
+    def test_token_bucket_limits_rate(self):
+        bot = FakeBot()
+        started = time.monotonic()
+        run_broadcast(range(1, 31), bot, rate=50, capacity=5)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(len(bot.sends), 30)
+        # 5 сообщений сразу из запаса корзины, остальные 25 - со скоростью 50 в секунду
+        self.assertGreaterEqual(elapsed, 0.45)
+        first_send = bot.sends[0][0]
+        self.assertLessEqual(sum(1 for sent_at, _, _ in bot.sends if sent_at - first_send < 0.1), 5 + 5 + 1)
+
+    def test_retry_after_pauses_and_retries(self):
+        bot = FakeBot({1: [RetryAfter(0.3)]})
+        started = time.monotonic()
+        broadcast = run_broadcast([1, 2, 3], bot, rate=1000, capacity=1)
+
+        self.assertEqual(broadcast.sent, 3)
+        self.assertEqual(bot.attempts[1], 2)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(sorted(chat_id for _, chat_id, _ in bot.sends), [1, 2, 3])
+
+    def test_blocked_and_failed_users(self):
+        bot = FakeBot({
+            2: [Unauthorized("Forbidden: bot was blocked by the user")],
+            3: [BadRequest("Chat not found")],
+            4: [BadRequest("Message is too long")],
+        })
+        marked = []
+        broadcast = run_broadcast([1, 2, 3, 4, 5], bot, mark_blocked=marked.append)
+
+        self.assertEqual(broadcast.sent, 2)
+        # Заблокировавшие бота отмечаются одним вызовом после рассылки
+        self.assertEqual(len(marked), 1)
+        self.assertEqual(sorted(marked[0]), [2, 3])
+        self.assertEqual(broadcast.failed, [4])
+        # Ошибка запроса не повторяется
+        self.assertEqual(bot.attempts[4], 1)
+
+    def test_single_final_summary(self):
+        bot = FakeBot({2: [Unauthorized("Forbidden")], 3: [BadRequest("Message is too long")]})
+        status_message = FakeStatusMessage()
+        run_broadcast([1, 2, 3, 4], bot, status_message=status_message)
+
+        self.assertEqual(len(status_message.edits), 1)
+        self.assertIn("Рассылка завершена", status_message.edits[0])
+        self.assertIn("доставлено 2, заблокировали бота 1, ошибок 1", status_message.edits[0])
+
+    def test_no_blocked_users_does_not_mark(self):
+        marked = []
+        run_broadcast([1, 2], FakeBot(), mark_blocked=marked.append)
+        self.assertEqual(marked, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,21 @@
 # File path: utils.py
 import re
-import json
 import os
-from func import extract_schedule_to_json
+import threading
+import time
+from collections import OrderedDict
+from bisect import bisect_right
+import pytz
+from datetime import date, datetime, time as day_time, timedelta
+from func import extract_schedule, week_days
+from keyboards import GroupKeyboards
+from metrics import set_gauge
+from snapshot import file_digest, load_snapshot, save_snapshot
 
 GROUPS_PER_PAGE = 5 
+# Часовой пояс колледжа (Киров, UTC+3): в нём заданы даты и время пар.
+# Именно pytz: планировщик задач python-telegram-bot 13 (APScheduler 3.6) принимает только его часовые пояса
+LOCAL_TIMEZONE = pytz.timezone('Europe/Kirov')
 
 def normalize_string(s):
     """Normalize strings by removing spaces and converting to lowercase."""
@@ -21,34 +32,86 @@ def filter_groups(user_input, groups):
     filtered_groups = [group for group in groups if all(part in normalize_string(group) for part in input_parts)]
     return filtered_groups
 
+class GroupIndex:
+    """Group search index built once per schedule version.
+
+    Names are normalized once. Every 1-3 character n-gram points to the set of groups
+    containing it, so a query intersects a few small sets instead of scanning all names.
+    """
+    NGRAM_MAX = 3
+    MAX_RESULTS = 20  # Не больше кнопок, чем разумно помещается в одну inline-клавиатуру
+
+    def __init__(self, group_names):
+        self.group_names = list(group_names)
+        self.normalized = [normalize_string(group) for group in self.group_names]
+        # Без общего префикса "группа" сравниваем качество совпадения
+        self.short_names = [name[len("группа"):] if name.startswith("группа") else name for name in self.normalized]
+        self.postings = {}
+        for group_id, name in enumerate(self.normalized):
+            for n in range(1, self.NGRAM_MAX + 1):
+                for i in range(len(name) - n + 1):
+                    self.postings.setdefault(name[i:i + n], set()).add(group_id)
+
+    def candidates(self, part):
+        """Groups whose normalized name contains part."""
+        if len(part) <= self.NGRAM_MAX:
+            return self.postings.get(part, set())
+        grams = [part[i:i + self.NGRAM_MAX] for i in range(len(part) - self.NGRAM_MAX + 1)]
+        posting_sets = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        found = set(posting_sets[0]).intersection(*posting_sets[1:])
+        # Наличие всех n-грамм ещё не гарантирует подстроку, проверяем оставшихся кандидатов
+        return {group_id for group_id in found if part in self.normalized[group_id]}
+
+    def search(self, user_input, limit=MAX_RESULTS):
+        """Groups matching every alphanumeric part of the input, best matches first."""
+        normalized_input = normalize_string(user_input)
+        input_parts = split_string(normalized_input)
+        if not input_parts:
+            return self.group_names[:limit]
+
+        matched = None
+        for part in sorted(input_parts, key=len, reverse=True):
+            found = self.candidates(part)
+            matched = set(found) if matched is None else matched & found
+            if not matched:
+                return []
+
+        def rank(group_id):
+            short_name = self.short_names[group_id]
+            position = short_name.find(input_parts[0])
+            return (short_name != normalized_input, not short_name.startswith(normalized_input),
+                    position if position >= 0 else len(short_name), len(short_name), group_id)
+
+        return [self.group_names[group_id] for group_id in sorted(matched, key=rank)[:limit]]
+
 def format_schedule_for_group(group_schedule):
     """Format the schedule for a specific group."""
     schedule_text = ""
     for day, classes in group_schedule.items():
         schedule_text += f"\n{day}:\n"
         for class_session in classes:
-            schedule_text += f"{class_session['Time']} - {class_session['Discipline']} ({class_session['Type of Class']})\n"
+            schedule_text += f"{class_session.time} - {class_session.discipline} ({class_session.type_of_class})\n"
     return schedule_text
 
 def format_class_session(class_session):
     """Format individual class sessions for display, skipping 'nan' entries."""
-    if class_session['Discipline'].strip().lower() == 'nan':
+    if class_session.discipline.strip().lower() == 'nan':
         return None
 
     # Разделение информации о нескольких подгруппах
-    disciplines = class_session['Discipline'].split('\n')
-    teachers = class_session['Teacher'].split('\n')
-    auditoriums = class_session['Auditorium'].split('\n')
+    disciplines = class_session.discipline.split('\n')
+    teachers = class_session.teacher.split('\n')
+    auditoriums = class_session.auditorium.split('\n')
     
     formatted_session = ""
-    time = f"<u>{class_session['Time']}</u>"  # Подчеркиваем время для обычных занятий
+    time = f"<u>{class_session.time}</u>"  # Подчеркиваем время для обычных занятий
 
     # Обходим каждую подгруппу
     for idx, discipline in enumerate(disciplines):
         if discipline.lower() == 'nan':
             continue
 
-        type_of_class = f"[{class_session['Type of Class']}]" if class_session['Type of Class'] else ""
+        type_of_class = f"[{class_session.type_of_class}]" if class_session.type_of_class else ""
         teacher = f"Преп: {teachers[idx]}" if idx < len(teachers) and teachers[idx] else ""
         auditorium = f"Ауд: {auditoriums[idx]}" if idx < len(auditoriums) and auditoriums[idx] else ""
         
@@ -61,81 +124,376 @@ def format_class_session(class_session):
 
     return formatted_session.strip()
 
+class ScheduleState:
+    """Parsed schedule together with every index derived from it.
+
+    Handlers read one state object and never see a half-updated schedule:
+    a reload builds a new ScheduleState and swaps the reference.
+    """
+    __slots__ = ('schedule_data', 'teacher_index', 'render_cache', 'group_index', 'group_hashes',
+                 'group_times', 'teacher_times', 'room_index', 'teacher_names', 'keyboards', 'ical_files', 'day_dates')
+
+    def __init__(self, schedule_data, day_dates, teacher_index, group_times, teacher_times):
+        self.schedule_data = schedule_data
+        # Календарные даты дней листа: 'дд.мм' -> date
+        self.day_dates = day_dates
+        self.teacher_index = teacher_index
+        self.group_times = group_times
+        self.teacher_times = teacher_times
+        self.render_cache = RenderCache(schedule_data)
+        self.group_index = GroupIndex(schedule_data.keys())
+        self.room_index = RoomIndex(schedule_data)
+        self.teacher_names = TeacherNameIndex(teacher_index.keys())
+        self.keyboards = GroupKeyboards(schedule_data, GROUPS_PER_PAGE)
+        # file_id уже отправленных .ics: ('group'|'teacher', имя) -> id файла на серверах Telegram
+        self.ical_files = {}
+        self.group_hashes = {group_name: group_schedule.content_hash() for group_name, group_schedule in schedule_data.items()}
+
+def build_schedule_state(schedule_data):
+    """Build all derived indexes for a freshly parsed schedule."""
+    started = time.perf_counter()
+    day_dates = sheet_dates(schedule_data, datetime.now(LOCAL_TIMEZONE).date())
+    group_times, teacher_times = build_time_indexes(schedule_data, day_dates)
+    state = ScheduleState(schedule_data, day_dates, build_teacher_index(schedule_data), group_times, teacher_times)
+    set_gauge('bot_schedule_index_seconds', time.perf_counter() - started)
+    set_gauge('bot_schedule_groups', len(schedule_data))
+    set_gauge('bot_schedule_sessions', sum(len(day_schedule) for group_schedule in schedule_data.values()
+                                           for day_schedule in group_schedule.days))
+    return state
+
+def parse_workbook(file_path, executor=None):
+    """extract_schedule that also records how long the parse took.
+
+    With a process pool executor the CPU-bound parse runs outside the bot process and does not hold the GIL
+    for the handler threads; the parsed schedule comes back pickled, like the snapshot.
+    """
+    started = time.perf_counter()
+    if executor is not None:
+        schedule_data = executor.submit(extract_schedule, file_path).result()
+    else:
+        schedule_data = extract_schedule(file_path)
+    set_gauge('bot_schedule_parse_seconds', time.perf_counter() - started)
+    return schedule_data
+
 def load_schedule(file_path):
+    """Load the schedule and build the teacher index once for all searches.
+
+    A snapshot of the parsed schedule next to the workbook is used when its hash matches,
+    so a restart does not re-parse the xlsx.
+    """
     if os.path.exists(file_path):
         try:
-            schedule_json = extract_schedule_to_json(file_path)
-            schedule_data = json.loads(schedule_json)
+            digest = file_digest(file_path)
+            schedule_data = load_snapshot(file_path, digest)
+            if schedule_data is None:
+                schedule_data = parse_workbook(file_path)
+                save_snapshot(file_path, digest, schedule_data)
+            state = build_schedule_state(schedule_data)
             print("Расписание успешно загружено из файла.")
-            return schedule_data
+            return state
         except Exception as e:
             print(f"Ошибка при загрузке расписания: {e}")
-            return {}
+            return build_schedule_state({})
     else:
         print("Файл с расписанием не найден. Пожалуйста, загрузите файл.")
-        return {}
+        return build_schedule_state({})
+
+def reload_schedule(upload_path, file_path, executor=None):
+    """Parse an uploaded workbook and only then move it over file_path.
+
+    Raises on a broken file, leaving the current workbook and snapshot untouched.
+    """
+    digest = file_digest(upload_path)
+    schedule_data = parse_workbook(upload_path, executor)
+    if not schedule_data:
+        raise ValueError("в файле не найдено ни одной группы")
+    state = build_schedule_state(schedule_data)
+    os.replace(upload_path, file_path)
+    save_snapshot(file_path, digest, schedule_data)
+    return state
+
+def render_day(day_schedule):
+    """Render one Day as HTML: bold header line followed by the non-empty sessions."""
+    lines = [f"<b>{day_schedule.name}:</b>"]
+    lines.extend(formatted for formatted in map(format_class_session, day_schedule) if formatted)
+    return "\n".join(lines) + "\n"
 
 def get_schedule_for_day(schedule_data, group_name, day_offset):
     """Generate schedule text for a specific day."""
     if group_name not in schedule_data:
         return "Группа не найдена."
 
-    week_days = list(schedule_data[group_name].keys())
+    week_days = schedule_data[group_name].days
     
     if day_offset < 0 or day_offset >= len(week_days):
-        return "Информация для этого дня недоступна.", False
-    
-    day_name = week_days[day_offset]
-    day_schedule = schedule_data[group_name][day_name]
+        return "Информация для этого дня недоступна."
     
-    schedule_text = f"<b>{day_name}:</b>\n"
-    for class_session in day_schedule:
-        formatted_session = format_class_session(class_session)
-        if formatted_session:  
-            schedule_text += f"{formatted_session}\n"
-    
-    return schedule_text
+    return render_day(week_days[day_offset])
 
 def get_schedule_for_week(schedule_data, group_name):
     """Generate schedule text for the entire week."""
     if group_name not in schedule_data:
         return "Группа не найдена."
 
-    week_schedule = schedule_data[group_name]
-    schedule_text = ""
-    
-    for day_name, day_schedule in week_schedule.items():
-        schedule_text += f"<b>{day_name}:</b>\n"
-        for class_session in day_schedule:
-            formatted_session = format_class_session(class_session)
-            if formatted_session:  
-                schedule_text += f"{formatted_session}\n"
-        schedule_text += "\n"
-        
-    return schedule_text
+    return "".join(render_day(day_schedule) + "\n" for day_schedule in schedule_data[group_name].days)
 
+class RenderCache:
+    """Rendered day/week texts of one schedule version.
 
+    Keys are (group, day index) and (group, 'week'); day buttons carry the date, which maps to the day index.
+    The cache lives inside ScheduleState, so a reload starts from an empty one.
+    """
+    WEEK = 'week'
 
+    def __init__(self, schedule_data):
+        self.schedule_data = schedule_data
+        self.day_offsets = {(group_name, day_schedule.date): day_offset
+                            for group_name, group_schedule in schedule_data.items()
+                            for day_offset, day_schedule in enumerate(group_schedule.days)}
+        self.rendered = {}
+        self.hits = 0
+        self.misses = 0
 
+    def day(self, group_name, day_offset):
+        key = (group_name, day_offset)
+        text = self.rendered.get(key)
+        if text is not None:
+            self.hits += 1
+            return text
+        self.misses += 1
+        text = get_schedule_for_day(self.schedule_data, group_name, day_offset)
+        # Сообщения об ошибках не кешируем, чтобы не засорять кеш произвольными ключами
+        if group_name in self.schedule_data and 0 <= day_offset < len(self.schedule_data[group_name].days):
+            self.rendered[key] = text
+        return text
 
-def find_teacher_days(schedule_data, teacher_lastname):
-    """Найти все дни с занятиями для указанного учителя."""
-    teacher_days = {}
+    def day_by_date(self, group_name, day_month):
+        """Rendered day by its date ('дд.мм'), or None when this schedule has no such day."""
+        day_offset = self.day_offsets.get((group_name, day_month))
+        return self.day(group_name, day_offset) if day_offset is not None else None
+
+    def week(self, group_name):
+        key = (group_name, self.WEEK)
+        text = self.rendered.get(key)
+        if text is not None:
+            self.hits += 1
+            return text
+        self.misses += 1
+        text = get_schedule_for_week(self.schedule_data, group_name)
+        if group_name in self.schedule_data:
+            self.rendered[key] = text
+        return text
+
+    def warm(self, group_names):
+        """Render week and every day up front for the given groups."""
+        for group_name in group_names:
+            group_schedule = self.schedule_data.get(group_name)
+            if group_schedule is None:
+                continue
+            for day_offset, day_schedule in enumerate(group_schedule.days):
+                self.rendered[(group_name, day_offset)] = render_day(day_schedule)
+            self.rendered[(group_name, self.WEEK)] = get_schedule_for_week(self.schedule_data, group_name)
+
+    def stats(self):
+        return {'entries': len(self.rendered), 'hits': self.hits, 'misses': self.misses}
+
+def teacher_key(teacher):
+    """Normalized surname of a teacher cell, e.g. 'Лялина Е. Е.' -> 'лялина'."""
+    parts = teacher.split()
+    return parts[0].lower() if parts else ""
+
+def session_teacher_keys(class_session, formatted_session):
+    """Teacher keys of a session that are actually shown in its formatted text."""
+    formatted_lower = formatted_session.lower()
+    # Один и тот же преподаватель может встречаться в нескольких подгруппах занятия,
+    # а преподаватель пропущенной подгруппы в отформатированное занятие не попадает
+    keys = {teacher_key(teacher) for teacher in class_session.teacher.split('\n')}
+    return {key for key in keys if key and key in formatted_lower}
+
+def build_teacher_index(schedule_data):
+    """Build surname -> [(day, start time, group, formatted session)] sorted by start time."""
+    teacher_index = {}
     for group_name, week_schedule in schedule_data.items():
-        for day_name, day_schedule in week_schedule.items():
+        for day_schedule in week_schedule.days:
+            day_name = day_schedule.name
             for class_session in day_schedule:
-                teachers = class_session['Teacher'].split('\n')
                 formatted_session = format_class_session(class_session)
-                if formatted_session and any(teacher_lastname.lower() in teacher.lower() for teacher in teachers):
-                    if day_name not in teacher_days:
-                        teacher_days[day_name] = []
-                    # Добавляем проверку на вхождение имени преподавателя в отформатированную сессию
-                    if teacher_lastname.lower() in formatted_session.lower():
-                        teacher_days[day_name].append(formatted_session)
+                if not formatted_session:
+                    continue
+                start_time = parse_time_range(class_session.time)[0]
+                for key in session_teacher_keys(class_session, formatted_session):
+                    teacher_index.setdefault(key, []).append((day_name, start_time, group_name, formatted_session))
+
+    for entries in teacher_index.values():
+        entries.sort(key=lambda entry: entry[1])
+    return teacher_index
+
+def find_teacher_days(teacher_index, teacher_lastname):
+    """Найти все дни с занятиями для указанного учителя."""
+    key = teacher_key(teacher_lastname)
+    if key in teacher_index:
+        entries = teacher_index[key]
+    else:
+        # Частичное совпадение фамилии проверяем только по ключам индекса
+        entries = sorted(
+            (entry for name, name_entries in teacher_index.items() if key and key in name for entry in name_entries),
+            key=lambda entry: entry[1]
+        )
+
+    teacher_days = {}
+    for day_name, start_time, group_name, formatted_session in entries:
+        teacher_days.setdefault(day_name, []).append(formatted_session)
     return teacher_days
 
-from datetime import datetime
-import re
+# Латинские буквы, которые выглядят как русские, и раскладка клавиатуры для фамилий, набранных в английской раскладке
+LATIN_LOOKALIKES = str.maketrans("aeopcxykmthb", "аеорсхукмтнв")
+KEYBOARD_LAYOUT = str.maketrans("qwertyuiop[]asdfghjkl;'zxcvbnm,.`", "йцукенгшщзхъфывапролджэячсмитьбюё")
+
+def normalize_teacher_name(name):
+    return name.lower().replace('ё', 'е')
+
+def levenshtein(a, b):
+    """Edit distance between two strings (bit-parallel algorithm of Myers/Hyyrö, a handful of int ops per char)."""
+    if not a or not b:
+        return len(a) or len(b)
+    char_masks = {}
+    for i, char in enumerate(a):
+        char_masks[char] = char_masks.get(char, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    positive, negative, distance = full, 0, len(a)
+    for char in b:
+        equal = char_masks.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = (negative | ~(horizontal | positive)) & full
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = (horizontal_negative | ~(vertical | horizontal_positive)) & full
+        negative = horizontal_positive & vertical
+    return distance
+
+class TeacherNameIndex:
+    """BK-tree over teacher surnames: typo-tolerant lookup without comparing the query to every name."""
+    MAX_MATCHES = 8  # Кнопок выбора преподавателя не больше этого числа
+
+    def __init__(self, teacher_keys):
+        self.keys_by_name = {}
+        for key in sorted(teacher_keys):
+            self.keys_by_name.setdefault(normalize_teacher_name(key), []).append(key)
+        self.names = list(self.keys_by_name)
+        self.root = None
+        for name in self.names:
+            self.add(name)
+
+    def add(self, name):
+        if self.root is None:
+            self.root = (name, {})
+            return
+        node = self.root
+        while True:
+            distance = levenshtein(name, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (name, {})
+                return
+            node = child
+
+    def within(self, query, max_distance):
+        """[(distance, name)] of names at most max_distance edits away from query."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            name, children = stack.pop()
+            distance = levenshtein(query, name)
+            if distance <= max_distance:
+                found.append((distance, name))
+            # По неравенству треугольника нужные имена лежат только в этих поддеревьях
+            for child_distance in range(max(distance - max_distance, 1), distance + max_distance + 1):
+                child = children.get(child_distance)
+                if child is not None:
+                    stack.append(child)
+        return found
+
+    def match(self, teacher_lastname):
+        """Teacher keys for a query: exact surname, else surnames containing it, else the closest by typos."""
+        query = normalize_teacher_name(teacher_key(teacher_lastname))
+        if not query:
+            return []
+        variants = [query]
+        for variant in (query.translate(LATIN_LOOKALIKES), query.translate(KEYBOARD_LAYOUT) if query.isascii() else query):
+            if variant not in variants:
+                variants.append(variant)
+
+        for variant in variants:
+            if variant in self.keys_by_name:
+                return list(self.keys_by_name[variant])
+
+        names = [name for name in self.names if any(variant in name for variant in variants)]
+        if not names:
+            # Одна опечатка на короткую фамилию, две на длинную
+            max_distance = 1 if len(query) <= 4 else 2
+            distances = {}
+            for variant in variants:
+                for distance, name in self.within(variant, max_distance):
+                    distances[name] = min(distance, distances.get(name, distance))
+            # Оставляем только самые близкие фамилии, чтобы одна опечатка давала один вариант
+            closest = min(distances.values(), default=0)
+            names = sorted(name for name, distance in distances.items() if distance == closest)
+        return [key for name in names[:self.MAX_MATCHES] for key in self.keys_by_name[name]]
+
+# Общий кеш результатов поиска преподавателей: размер и время жизни записи (секунды)
+TEACHER_CACHE_SIZE = 256
+TEACHER_CACHE_TTL = 600.0
+
+class TeacherResultCache:
+    """Shared LRU of teacher search results keyed by the normalized query.
+
+    A result is [(teacher key, {day name: [sessions]})] for every matched teacher. Entries expire after ttl
+    and remember the ScheduleState they were built from, so an old schedule is never served after a reload.
+    """
+
+    def __init__(self, maxsize=TEACHER_CACHE_SIZE, ttl=TEACHER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # запрос -> (состояние расписания, срок годности, результат)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, schedule_state, query):
+        key = normalize_teacher_name(teacher_key(query))
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] is schedule_state and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        result = [(teacher, find_teacher_days(schedule_state.teacher_index, teacher))
+                  for teacher in schedule_state.teacher_names.match(key)]
+        with self.lock:
+            self.entries[key] = (schedule_state, now + self.ttl, result)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
 
 def parse_time(time_str):
     """Parse time from the formatted session string, removing HTML tags."""
@@ -149,8 +507,190 @@ def parse_time(time_str):
 def show_teacher_schedule_for_day(teacher_days, day_name):
     """Вывести расписание для учителя в выбранный день, отсортированное по времени."""
     if day_name in teacher_days:
-        # Сортируем список занятий по времени начала
-        sorted_sessions = sorted(teacher_days[day_name], key=lambda x: parse_time(x))
-        return "\n".join(sorted_sessions)
+        # Занятия уже отсортированы по времени начала в индексе преподавателей
+        return "\n".join(teacher_days[day_name])
     else:
         return "В этот день занятий у указанного учителя нет."
+
+parsed_time_ranges = {}
+
+def parse_time_range(time_str):
+    """Parse '8.20-9.50' or '18.55 - 20.25' into (start, end) times; memoized, the sheet has a dozen distinct slots."""
+    time_range = parsed_time_ranges.get(time_str)
+    if time_range is None:
+        start_str, end_str = (part.strip() for part in time_str.split('-'))
+        start_hour, start_minute = start_str.split('.')
+        end_hour, end_minute = end_str.split('.')
+        time_range = (day_time(int(start_hour), int(start_minute)), day_time(int(end_hour), int(end_minute)))
+        parsed_time_ranges[time_str] = time_range
+    return time_range
+
+# Номер дня недели по названию из листа, как у date.weekday()
+WEEKDAY_NUMBERS = {name.lower(): number for number, name in enumerate(week_days + ["Воскресенье"])}
+# Дни недели одной даты повторяются с периодом не больше 11 лет (кроме 29.02)
+WEEKDAY_SEARCH_YEARS = 11
+
+def resolve_date(day_month, today, weekday=None):
+    """Date for 'дд.мм': the nearest year in which it falls on the sheet's weekday, else the year closest to today."""
+    try:
+        day, month = (int(part) for part in day_month.split('.'))
+    except ValueError:
+        return None
+    weekday_number = WEEKDAY_NUMBERS.get(weekday.strip().lower()) if weekday else None
+    shifts = range(-WEEKDAY_SEARCH_YEARS, WEEKDAY_SEARCH_YEARS + 1) if weekday_number is not None else (-1, 0, 1)
+    candidates = []
+    for shift in shifts:
+        try:
+            candidates.append(date(today.year + shift, month, day))
+        except ValueError:
+            continue
+    matching = [candidate for candidate in candidates if candidate.weekday() == weekday_number]
+    nearest = [candidate for candidate in candidates if abs(candidate.year - today.year) <= 1]
+    if not (matching or nearest):
+        return None
+    return min(matching or nearest, key=lambda candidate: abs(candidate - today))
+
+def sheet_dates(schedule_data, today):
+    """{'дд.мм': date} for the days of a sheet.
+
+    Only the first day gets its year from resolve_date; every other day is placed in the same week by its
+    weekday, so one sheet never spreads over two weeks or two years.
+    """
+    first_day = next((group_schedule.days[0] for group_schedule in schedule_data.values() if group_schedule.days), None)
+    anchor = resolve_date(first_day.date, today, first_day.weekday) if first_day else None
+    if anchor is None:
+        return {}
+    monday = anchor - timedelta(days=WEEKDAY_NUMBERS.get(first_day.weekday.lower(), anchor.weekday()))
+    day_dates = {}
+    for group_schedule in schedule_data.values():
+        for day_schedule in group_schedule.days:
+            if day_schedule.date in day_dates:
+                continue
+            weekday_number = WEEKDAY_NUMBERS.get(day_schedule.weekday.lower())
+            day_dates[day_schedule.date] = (monday + timedelta(days=weekday_number) if weekday_number is not None
+                                            else resolve_date(day_schedule.date, anchor))
+    return day_dates
+
+def schedule_date(schedule_state, day_month, today):
+    """Date for 'дд.мм' typed by a user: the date the loaded sheet gives it, otherwise resolve_date."""
+    try:
+        day, month = (int(part) for part in day_month.split('.'))
+    except ValueError:
+        return None
+    day_date = schedule_state.day_dates.get(f"{day:02d}.{month:02d}")
+    return day_date if day_date is not None else resolve_date(day_month, today)
+
+class TimeIndex:
+    """Sessions of one group or teacher as sorted [start, end) intervals for O(log n) lookups."""
+    __slots__ = ('starts', 'ends', 'entries')
+
+    def __init__(self, intervals):
+        intervals.sort(key=lambda interval: interval[0])
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+        self.entries = [(interval[2], interval[3]) for interval in intervals]  # (день, текст занятия)
+
+    def current_and_next(self, moment):
+        """((day name, text) of the class going on at moment or None, the next class or None)."""
+        i = bisect_right(self.starts, moment)
+        current = self.entries[i - 1] if i and self.ends[i - 1] > moment else None
+        upcoming = self.entries[i] if i < len(self.entries) else None
+        return current, upcoming
+
+def build_time_indexes(schedule_data, day_dates):
+    """Convert every session into real datetimes and build TimeIndex per group and per teacher."""
+    group_intervals = {}
+    teacher_intervals = {}
+    for group_name, week_schedule in schedule_data.items():
+        intervals = group_intervals.setdefault(group_name, [])
+        for day_schedule in week_schedule.days:
+            day_date = day_dates.get(day_schedule.date)
+            if day_date is None:
+                continue
+            for class_session in day_schedule:
+                formatted_session = format_class_session(class_session)
+                if not formatted_session:
+                    continue
+                start_time, end_time = parse_time_range(class_session.time)
+                interval = (datetime.combine(day_date, start_time), datetime.combine(day_date, end_time),
+                            day_schedule.name, formatted_session)
+                intervals.append(interval)
+                for key in session_teacher_keys(class_session, formatted_session):
+                    teacher_intervals.setdefault(key, []).append(interval)
+
+    group_times = {group_name: TimeIndex(intervals) for group_name, intervals in group_intervals.items()}
+    teacher_times = {key: TimeIndex(intervals) for key, intervals in teacher_intervals.items()}
+    return group_times, teacher_times
+
+# Сокращения дней недели для команд вида /free_rooms пн 3
+SHORT_WEEK_DAYS = {"пн": "понедельник", "вт": "вторник", "ср": "среда", "чт": "четверг", "пт": "пятница", "сб": "суббота"}
+
+def room_sort_key(room):
+    """'2-209' < '5-113' < '15-111': numbers inside the name compare as numbers."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', room)]
+
+class RoomIndex:
+    """Auditorium occupancy as bitmaps: one int per (day, slot), bit i set when rooms[i] is busy.
+
+    Rooms free for several consecutive slots are all_rooms & ~(busy | busy | ...), no group is scanned per query.
+    """
+    __slots__ = ('rooms', 'all_rooms', 'days', 'slot_times', 'occupied')
+
+    def __init__(self, schedule_data):
+        rooms = set()
+        for week_schedule in schedule_data.values():
+            for day_schedule in week_schedule.days:
+                for class_session in day_schedule:
+                    rooms.update(room.strip() for room in class_session.auditorium.split('\n'))
+        rooms.discard('')
+        self.rooms = sorted(rooms, key=room_sort_key)
+        self.all_rooms = (1 << len(self.rooms)) - 1
+        room_bits = {room: 1 << i for i, room in enumerate(self.rooms)}
+
+        self.days = []  # Day в порядке недели, по одному на каждое название дня
+        self.slot_times = {}  # название дня -> время пар по порядку
+        self.occupied = {}  # название дня -> битовые маски занятых аудиторий по парам
+        for week_schedule in schedule_data.values():
+            for day_schedule in week_schedule.days:
+                if day_schedule.name not in self.slot_times:
+                    self.days.append(day_schedule)
+                    self.slot_times[day_schedule.name] = []
+                    self.occupied[day_schedule.name] = []
+                slot_times = self.slot_times[day_schedule.name]
+                occupied = self.occupied[day_schedule.name]
+                for class_session in day_schedule:
+                    if class_session.time not in slot_times:
+                        slot_times.append(class_session.time)
+                        occupied.append(0)
+                    if class_session.discipline.strip().lower() == 'nan':
+                        continue
+                    # У подгрупп аудитории перечислены через перевод строки, каждая из них занята
+                    mask = 0
+                    for room in class_session.auditorium.split('\n'):
+                        mask |= room_bits.get(room.strip(), 0)
+                    occupied[slot_times.index(class_session.time)] |= mask
+
+    def find_day(self, day_arg, today):
+        """Day by 'сегодня', 'завтра', weekday name or its prefix ('пн', 'втор'), or date '15.04'."""
+        day_arg = day_arg.strip().lower()
+        if day_arg in ("сегодня", "завтра"):
+            target = today + timedelta(days=1 if day_arg == "завтра" else 0)
+            day_arg = target.strftime("%d.%m")
+        day_arg = SHORT_WEEK_DAYS.get(day_arg, day_arg)
+        for day_schedule in self.days:
+            if day_schedule.date == day_arg or (day_arg and day_schedule.weekday.lower().startswith(day_arg)):
+                return day_schedule
+        return None
+
+    def free_rooms(self, day_name, first_slot, slot_count=1):
+        """Rooms free in slots first_slot .. first_slot + slot_count - 1 (0-based) of the day."""
+        busy = 0
+        for mask in self.occupied[day_name][first_slot:first_slot + slot_count]:
+            busy |= mask
+        free = self.all_rooms & ~busy
+        rooms = []
+        while free:
+            lowest = free & -free
+            rooms.append(self.rooms[lowest.bit_length() - 1])
+            free ^= lowest
+        return rooms